@@ -1,8 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
-from .models import User, Tutor, Student, Location, ProfilePicture
+from .models import User, Tutor, TutorSubject, Student, Location, ProfilePicture
 
 
-admin.site.register([Tutor, Student, Location, ProfilePicture])
+admin.site.register([Tutor, TutorSubject, Student, Location, ProfilePicture])
 admin.site.register(User, UserAdmin)
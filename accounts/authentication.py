@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from . import identity
+
+
+def token_cache_key(key):
+    return f'auth-token:{key}'
+
+
+def user_cache_key(user_pk):
+    return f'auth-token-user:{user_pk}'
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    Token authentication that keeps tokens together with their user and the
+    user's profile in the cache for ``TOKEN_CACHE_TIMEOUT`` seconds, so most
+    requests don't query the database before reaching the view. Entries are
+    dropped when the token, the user or the profile changes (see signals).
+    Nothing is cached unless ``CACHE_USER_DATA`` is set.
+    """
+
+    def authenticate_credentials(self, key):
+        token = cache.get(token_cache_key(key)) if settings.CACHE_USER_DATA else None
+        if token is None:
+            model = self.get_model()
+            try:
+                token = model.objects.select_related('user__student', 'user__tutor').get(key=key)
+            except model.DoesNotExist:
+                raise exceptions.AuthenticationFailed(_('Invalid token.'))
+            if settings.CACHE_USER_DATA:
+                cache.set_many({
+                    token_cache_key(key): token,
+                    user_cache_key(token.user_id): key,
+                }, settings.TOKEN_CACHE_TIMEOUT)
+
+        if not token.user.is_active:
+            raise exceptions.AuthenticationFailed(_('User inactive or deleted.'))
+        identity.remember(token.user)
+        return (token.user, token)
+
+
+def invalidate_key(key):
+    cache.delete(token_cache_key(key))
+
+
+def invalidate_user(user_pk):
+    """Forget the cached token of a user, now and again once the transaction commits."""
+    def invalidate():
+        key = cache.get(user_cache_key(user_pk))
+        if key is not None:
+            cache.delete_many([token_cache_key(key), user_cache_key(user_pk)])
+    invalidate()
+    transaction.on_commit(invalidate)
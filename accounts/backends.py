@@ -0,0 +1,15 @@
+from django.contrib.auth import backends
+
+from . import identity
+from .models import User
+
+
+class ModelBackend(backends.ModelBackend):
+    """Loads session users together with their student or tutor profile."""
+
+    def get_user(self, user_id):
+        user = User.objects.select_related('student', 'tutor').filter(pk=user_id).first()
+        if user is None or not self.user_can_authenticate(user):
+            return None
+        identity.remember(user)
+        return user
@@ -1,31 +1,54 @@
 from django.contrib.gis.geos import Point
 from django.contrib.gis.db import models
-from django.contrib.gis.db.models.functions import Distance, DistanceField
+from django.contrib.gis.db.models.functions import Distance
 from django.contrib.gis.measure import D
 import django_filters as filters
 
-from .models import Tutor, Location
+from . import geocache
+from .models import Tutor, TutorSubject
+from .search import rank_tutors
 
 class TutorFilterSet(filters.FilterSet):
     hourly_rate = filters.NumberFilter(field_name='hourly_rate', lookup_expr='lte')
     subject = filters.CharFilter(method='filter_subject')
+    subject_search = filters.CharFilter(method='filter_subject_search')
     rating = filters.NumberFilter(method='filter_rating')
     level = filters.ChoiceFilter(choices=Tutor.LEVEL_CHOICES, empty_label=None, method='filter_level')
     location = filters.CharFilter(method='filter_location')
+    radius = filters.NumberFilter(method='filter_radius')
+
+    # Search radius around ``location`` in km.
+    DEFAULT_RADIUS = 10
+    MAX_RADIUS = 200
 
     def filter_subject(self, queryset, name, value):
-        return queryset.filter(subjects__contains=[value])
+        return queryset.filter(pk__in=self.subject_queryset().values('tutor_id'))
+
+    def filter_subject_search(self, queryset, name, value):
+        return rank_tutors(queryset, value)
 
     def filter_rating(self, queryset, name, value):
         return queryset.filter(rating__gte=value)
 
     def filter_level(self, queryset, name, value):
-        if value == Tutor.PHD:
-            return queryset.filter(level=Tutor.PHD)
-        if value == Tutor.MASTER:
-            return queryset.filter(level__in=[Tutor.MASTER, Tutor.PHD])
-        if value == Tutor.BACHELOR:
-            return queryset.filter(level__in=[Tutor.BACHELOR, Tutor.MASTER, Tutor.PHD])
+        if self.form.cleaned_data.get('subject'):
+            # Already applied together with the subject, see filter_subject.
+            return queryset
+        return queryset.filter(pk__in=self.subject_queryset().values('tutor_id'))
+
+    def subject_queryset(self):
+        """Subjects matching both the subject and minimum level, so they apply to the same row."""
+        subject = self.form.cleaned_data.get('subject')
+        level = self.form.cleaned_data.get('level')
+        qs = TutorSubject.objects.all()
+        if subject:
+            qs = qs.filter(subject=subject)
+        if level:
+            qs = qs.filter(level__in=Tutor.levels_from(level))
+        return qs
+
+    def filter_radius(self, queryset, name, value):
+        # Applied as part of filter_location.
         return queryset
 
     def filter_location(self, queryset, name, value):
@@ -34,16 +57,31 @@ class TutorFilterSet(filters.FilterSet):
         except ValueError:
             return queryset
         point = Point(longitude, latitude, srid=4326)
+        radius = self.form.cleaned_data.get('radius')
+        if radius is None:
+            radius = self.DEFAULT_RADIUS
+        radius = min(max(float(radius), 0), self.MAX_RADIUS)
+        # Filtering before annotating makes Min() aggregate over the matching
+        # locations only: ST_DWithin is answered from the GiST index and the
+        # GROUP BY returns every tutor once with its nearest location.
         return queryset.filter(
-            locations__location__distance_lte=(point, D(km=10)),
+            pk__in=self.location_candidates(point, radius),
+            locations__location__dwithin=(point, D(km=radius)),
         ).annotate(
-            distance=models.Subquery(
-                Location.objects.filter(tutors__id=models.OuterRef('pk')).annotate(
-                    distance=Distance('location', point)
-                ).values('distance').order_by('distance')[:1],
-            ),
+            distance=models.Min(Distance('locations__location', point)),
         )
 
+    def location_candidates(self, point, radius):
+        """Cached ids of available tutors near ``point`` matching the rate, subject and level filters."""
+        data = self.form.cleaned_data
+        qs = Tutor.objects.filter(available=True)
+        if data.get('hourly_rate') is not None:
+            qs = qs.filter(hourly_rate__lte=data['hourly_rate'])
+        if data.get('subject') or data.get('level'):
+            qs = qs.filter(pk__in=self.subject_queryset().values('tutor_id'))
+        params = [data.get('subject'), data.get('level'), data.get('hourly_rate')]
+        return geocache.candidate_ids(point, radius, qs, params)
+
     class Meta:
         model = Tutor
-        fields = ['hourly_rate', 'subject', 'rating', 'level', 'location']
+        fields = ['hourly_rate', 'subject', 'subject_search', 'rating', 'level', 'location', 'radius']
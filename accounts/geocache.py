@@ -0,0 +1,117 @@
+"""
+Cache of location search candidates. Search coordinates are snapped to a
+geohash cell and the ids of all tutors within reach of anywhere in that cell
+are cached, so nearby searches share one entry and only the exact distance
+refinement runs against the candidates.
+"""
+import hashlib
+import math
+import time
+
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.core.cache import cache
+from django.db import transaction
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# Precision 6 cells are roughly 1.2 x 0.6 km.
+PRECISION = 6
+TIMEOUT = 5 * 60
+VERSION_KEY = 'tutor-search:version'
+EARTH_RADIUS_KM = 6371.0
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    geohash, bits, bit, even = [], 0, 0, True
+    while len(geohash) < precision:
+        value, interval = (longitude, lon_range) if even else (latitude, lat_range)
+        mid = (interval[0] + interval[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            interval[0] = mid
+        else:
+            interval[1] = mid
+        even = not even
+        bit += 1
+        if bit == 5:
+            geohash.append(BASE32[bits])
+            bits, bit = 0, 0
+    return ''.join(geohash)
+
+
+def bounds(geohash):
+    """(south, north, west, east) of a geohash cell."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        bits = BASE32.index(char)
+        for shift in range(4, -1, -1):
+            interval = lon_range if even else lat_range
+            mid = (interval[0] + interval[1]) / 2
+            if bits >> shift & 1:
+                interval[0] = mid
+            else:
+                interval[1] = mid
+            even = not even
+    return lat_range[0], lat_range[1], lon_range[0], lon_range[1]
+
+
+def haversine(latitude1, longitude1, latitude2, longitude2):
+    """Great circle distance in km."""
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(longitude2 - longitude1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate():
+    """Drop all cached candidates, e.g. when a tutor moves or changes availability or rate."""
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time() * 1000), None)
+
+
+def invalidate_on_commit():
+    """
+    Invalidate right away and once more after the transaction commits, so
+    candidates a concurrent search caches from the not yet committed state
+    meanwhile are dropped too.
+    """
+    invalidate()
+    transaction.on_commit(invalidate)
+
+
+def candidate_ids(point, radius, queryset, params):
+    """
+    Ids of tutors in ``queryset`` with a location within ``radius`` km of any
+    point in the geohash cell of ``point``. ``params`` must identify the
+    filters applied to ``queryset``.
+    """
+    cell = encode(point.y, point.x)
+    digest = hashlib.md5(repr([radius] + list(params)).encode('utf-8')).hexdigest()
+    key = f'tutor-search:{get_version()}:{cell}:{digest}'
+    ids = cache.get(key)
+    if ids is None:
+        south, north, west, east = bounds(cell)
+        center = Point((west + east) / 2, (south + north) / 2, srid=4326)
+        slack = max(
+            haversine(center.y, center.x, latitude, longitude)
+            for latitude in (south, north) for longitude in (west, east)
+        )
+        ids = list(queryset.filter(
+            locations__location__dwithin=(center, D(km=radius + slack)),
+        ).values_list('pk', flat=True).distinct())
+        cache.set(key, ids, TIMEOUT)
+    return ids
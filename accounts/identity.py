@@ -0,0 +1,50 @@
+"""
+Request-scoped identity map of user profiles. The profile loaded while
+authenticating is registered here, so other User instances of the same
+user within the request (e.g. ``obj.user`` of a fetched object) resolve
+``profile`` without querying again.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.core.exceptions import ObjectDoesNotExist
+
+_state = threading.local()
+
+
+@contextmanager
+def scope():
+    previous = getattr(_state, 'profiles', None)
+    _state.profiles = {}
+    try:
+        yield
+    finally:
+        _state.profiles = previous
+
+
+def get_profile(user_pk):
+    profiles = getattr(_state, 'profiles', None)
+    return None if profiles is None else profiles.get(user_pk)
+
+
+def remember_profile(user_pk, profile):
+    profiles = getattr(_state, 'profiles', None)
+    if profiles is not None and profile is not None:
+        profiles[user_pk] = profile
+
+
+def remember(user):
+    """Register the profile of an authenticated user, if it has one."""
+    try:
+        remember_profile(user.pk, user.profile)
+    except ObjectDoesNotExist:
+        pass
+
+
+class IdentityMapMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with scope():
+            return self.get_response(request)
@@ -0,0 +1,73 @@
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+
+
+class Command(BaseCommand):
+    help = ("Issue requests through the full request cycle, with and without persistent database "
+            "connections, and report latency and how many connections were opened.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/api/tutors/?page_size=10')
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--conn-max-age', type=int, default=600,
+                            help="CONN_MAX_AGE of the persistent run.")
+
+    def handle(self, *args, **options):
+        settings_dict = connections.databases['default']
+        original = settings_dict['CONN_MAX_AGE']
+        try:
+            for max_age in (0, options['conn_max_age']):
+                settings_dict['CONN_MAX_AGE'] = max_age
+                connections['default'].close()
+                self.run(f'CONN_MAX_AGE={max_age}', options)
+        finally:
+            settings_dict['CONN_MAX_AGE'] = original
+
+    def run(self, name, options):
+        timings = []
+        opened = []
+        lock = threading.Lock()
+
+        def count(sender, connection, **kwargs):
+            with lock:
+                opened.append(connection.alias)
+
+        def worker(requests):
+            client = Client()
+            for _ in range(requests):
+                start = time.perf_counter()
+                response = client.get(options['path'])
+                elapsed = (time.perf_counter() - start) * 1000
+                if response.status_code != 200:
+                    raise RuntimeError(f"{options['path']} answered {response.status_code}")
+                with lock:
+                    timings.append(elapsed)
+            connections.close_all()
+
+        per_thread = max(options['requests'] // options['threads'], 1)
+        connection_created.connect(count)
+        try:
+            threads = [threading.Thread(target=worker, args=(per_thread,)) for _ in range(options['threads'])]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            total = time.perf_counter() - start
+        finally:
+            connection_created.disconnect(count)
+
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"{name}: {len(timings)} requests in {total:.1f} s ({len(timings) / total:.0f}/s), "
+            f"median {statistics.median(timings):.1f} ms, p95 {p95:.1f} ms, "
+            f"{len(opened)} connections opened"
+        )
@@ -0,0 +1,93 @@
+import random
+import statistics
+import time
+
+from django.contrib.gis.db.models.functions import Distance
+from django.contrib.gis.geos import Point
+from django.contrib.gis.measure import D
+from django.core.management.base import BaseCommand
+from django.db import connection, models, transaction
+
+from accounts.filters import TutorFilterSet
+from accounts.models import Location, Tutor, User
+from accounts.pagination import TutorPagination
+
+# Eindhoven, where the synthetic tutors are scattered around.
+CENTER = (5.4697225, 51.441642)
+
+
+class Command(BaseCommand):
+    help = ("Time the tutor location search against a synthetic data set. "
+            "Everything is created inside a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tutors', type=int, default=100000)
+        parser.add_argument('--locations-per-tutor', type=int, default=2)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--radius', type=float, default=TutorFilterSet.DEFAULT_RADIUS)
+        parser.add_argument('--spread', type=float, default=1.0,
+                            help="Maximum offset of tutor locations from the center, in degrees.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.populate(options['tutors'], options['locations_per_tutor'], options['spread'])
+            params = {'location': '%f,%f' % CENTER, 'radius': options['radius']}
+            self.report('indexed search', options['repeat'], lambda: self.search(params))
+            self.report('legacy subquery search', options['repeat'], lambda: self.legacy_search(params))
+            transaction.set_rollback(True)
+
+    def populate(self, count, locations_per_tutor, spread):
+        self.stdout.write(f"Creating {count} tutors with {locations_per_tutor} locations each...")
+        users = User.objects.bulk_create(
+            User(username=f'benchmark-{i}', type=User.TUTOR) for i in range(count)
+        )
+        tutors = Tutor.objects.bulk_create(
+            Tutor(user=user, rating=random.uniform(0, 5)) for user in users
+        )
+        links = []
+        for tutor in tutors:
+            for _ in range(locations_per_tutor):
+                longitude = CENTER[0] + random.uniform(-spread, spread)
+                latitude = CENTER[1] + random.uniform(-spread, spread)
+                links.append((tutor, Location(
+                    address='Benchmark', google_id='benchmark', longitude=longitude, latitude=latitude,
+                    location=Point(longitude, latitude, srid=4326),
+                )))
+        locations = Location.objects.bulk_create(location for tutor, location in links)
+        Tutor.locations.through.objects.bulk_create(
+            Tutor.locations.through(tutor_id=tutor.pk, location_id=location.pk)
+            for (tutor, _), location in zip(links, locations)
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def search(self, params):
+        qs = TutorFilterSet(params, queryset=Tutor.objects.filter(available=True)).qs
+        ordering = TutorPagination().get_ordering(qs)
+        return list(qs.order_by(*ordering)[:TutorPagination.page_size])
+
+    def legacy_search(self, params):
+        longitude, latitude = map(float, params['location'].split(','))
+        point = Point(longitude, latitude, srid=4326)
+        qs = Tutor.objects.filter(available=True).filter(
+            locations__location__distance_lte=(point, D(km=params['radius'])),
+        ).annotate(
+            distance=models.Subquery(
+                Location.objects.filter(tutors__id=models.OuterRef('pk')).annotate(
+                    distance=Distance('location', point)
+                ).values('distance').order_by('distance')[:1],
+            ),
+        )
+        return list(qs.order_by('distance', '-rating', 'pk')[:TutorPagination.page_size])
+
+    def report(self, name, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+        self.stdout.write(
+            f"{name}: median {statistics.median(timings):.1f} ms, p95 {p95:.1f} ms over {repeat} runs"
+        )
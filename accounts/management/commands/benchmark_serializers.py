@@ -0,0 +1,94 @@
+import datetime
+import random
+import statistics
+import time
+from decimal import Decimal
+
+from django.contrib.gis.geos import Point
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import Location, Student, Tutor, TutorSubject, User
+from accounts.representations import FastJSONRenderer, represent_tutors
+from accounts.serializers import TutorSerializer
+from accounts.views import TutorViewSet
+
+from .benchmark_search import CENTER
+
+SUBJECTS = ['Mathematics', 'Physics', 'Chemistry', 'Biology', 'English', 'App Development']
+
+
+class Command(BaseCommand):
+    help = ("Compare rendering tutors with TutorSerializer and with the fast path of "
+            "accounts/representations.py, and check that both produce the same bytes. "
+            "Everything is created inside a transaction that is rolled back.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tutors', type=int, default=5000)
+        parser.add_argument('--students-per-tutor', type=int, default=2)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.populate(options['tutors'], options['students_per_tutor'])
+            # Prefetched once, so only serialization and rendering are timed.
+            tutors = list(TutorViewSet.queryset.order_by('pk'))
+            serialized = self.serializer(tutors)
+            if self.fast(tutors) != serialized:
+                raise CommandError("The fast path does not render the same bytes as TutorSerializer.")
+            self.stdout.write(f"Rendering {len(tutors)} tutors, {len(serialized)} bytes")
+            self.report('TutorSerializer + JSONRenderer', options['repeat'], lambda: self.serializer(tutors))
+            self.report('fast path + FastJSONRenderer', options['repeat'], lambda: self.fast(tutors))
+            transaction.set_rollback(True)
+
+    def populate(self, count, students_per_tutor):
+        self.stdout.write(f"Creating {count} tutors with {students_per_tutor} students each...")
+        users = User.objects.bulk_create(
+            User(username=f'benchmark-{i}', type=User.TUTOR) for i in range(count)
+        )
+        tutors = Tutor.objects.bulk_create(Tutor(
+            user=user,
+            date_of_birth=datetime.date(1970, 1, 1) + datetime.timedelta(days=random.randrange(15000)),
+            gender=random.choice(['Female', 'Male', '']),
+            hourly_rate=Decimal(random.randrange(1000, 6000)) / 100,
+            rating=random.uniform(0, 5),
+        ) for user in users)
+        TutorSubject.objects.bulk_create(
+            TutorSubject(tutor=tutor, subject=subject, level=random.choice(Tutor.LEVELS))
+            for tutor in tutors for subject in random.sample(SUBJECTS, 2)
+        )
+        locations = Location.objects.bulk_create(Location(
+            address='Benchmark', google_id='benchmark', longitude=CENTER[0], latitude=CENTER[1],
+            location=Point(*CENTER, srid=4326),
+        ) for _ in tutors)
+        Tutor.locations.through.objects.bulk_create(
+            Tutor.locations.through(tutor_id=tutor.pk, location_id=location.pk)
+            for tutor, location in zip(tutors, locations)
+        )
+        student_users = User.objects.bulk_create(
+            User(username=f'benchmark-student-{i}', type=User.STUDENT) for i in range(count)
+        )
+        students = Student.objects.bulk_create(
+            Student(user=user, date_of_birth=datetime.date(2005, 6, 1)) for user in student_users
+        )
+        Student.tutors.through.objects.bulk_create(
+            Student.tutors.through(student_id=student.pk, tutor_id=tutor.pk)
+            for tutor in tutors for student in random.sample(students, students_per_tutor)
+        )
+
+    def serializer(self, tutors):
+        return JSONRenderer().render(TutorSerializer(tutors, many=True).data)
+
+    def fast(self, tutors):
+        return FastJSONRenderer().render(represent_tutors(tutors))
+
+    def report(self, name, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        self.stdout.write(
+            f"{name}: median {statistics.median(timings):.1f} ms, best {min(timings):.1f} ms over {repeat} runs"
+        )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import ProfilePicture
+
+
+class Command(BaseCommand):
+    help = ("Process pending picture uploads, e.g. ones whose background job was lost "
+            "when a worker restarted.")
+
+    def handle(self, *args, **options):
+        pending = ProfilePicture.objects.filter(status=ProfilePicture.PENDING).exclude(upload='')
+        count = 0
+        for picture in pending.iterator():
+            picture.process()
+            count += 1
+        self.stdout.write(f"Processed {count} pictures.")
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+
+from accounts.models import Tutor
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored rating aggregate of every tutor from their meeting reviews."
+
+    @transaction.atomic()
+    def handle(self, *args, **options):
+        tutors = Tutor.objects.annotate(
+            total=Sum('meetings__review__rating'),
+            count=Count('meetings__review'),
+        ).only('pk')
+        updated = 0
+        for tutor in tutors:
+            total, count = tutor.total or 0, tutor.count
+            Tutor.objects.filter(pk=tutor.pk).update(
+                rating_sum=total,
+                rating_count=count,
+                rating=total / count if count else 0.0,
+            )
+            updated += 1
+        self.stdout.write(f"Rebuilt ratings for {updated} tutors.")
@@ -0,0 +1,45 @@
+# Generated by Django 2.0 on 2026-10-18 10:12
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def compute_ratings(apps, schema_editor):
+    Tutor = apps.get_model('accounts', 'Tutor')
+    tutors = Tutor.objects.annotate(
+        total=Sum('meetings__review__rating'),
+        count=Count('meetings__review'),
+    ).filter(count__gt=0)
+    for tutor in tutors:
+        Tutor.objects.filter(pk=tutor.pk).update(
+            rating_sum=tutor.total,
+            rating_count=tutor.count,
+            rating=tutor.total / tutor.count,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_profilepicture'),
+        ('meetings', '0002_auto_20180326_1235'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tutor',
+            name='rating',
+            field=models.FloatField(db_index=True, default=0.0),
+        ),
+        migrations.AddField(
+            model_name='tutor',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='tutor',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(compute_ratings, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 2.0 on 2026-10-18 11:03
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_subjects_to_table(apps, schema_editor):
+    Tutor = apps.get_model('accounts', 'Tutor')
+    TutorSubject = apps.get_model('accounts', 'TutorSubject')
+    rows = []
+    for tutor in Tutor.objects.only('pk', 'subjects').iterator():
+        for subject in tutor.subjects:
+            if len(subject) != 2:
+                continue
+            rows.append(TutorSubject(tutor_id=tutor.pk, subject=subject[0], level=subject[1]))
+        if len(rows) >= 1000:
+            TutorSubject.objects.bulk_create(rows)
+            rows = []
+    TutorSubject.objects.bulk_create(rows)
+
+
+def copy_subjects_to_array(apps, schema_editor):
+    Tutor = apps.get_model('accounts', 'Tutor')
+    TutorSubject = apps.get_model('accounts', 'TutorSubject')
+    subjects = {}
+    for row in TutorSubject.objects.order_by('pk').iterator():
+        subjects.setdefault(row.tutor_id, []).append([row.subject, row.level])
+    for tutor_id, tutor_subjects in subjects.items():
+        Tutor.objects.filter(pk=tutor_id).update(subjects=tutor_subjects)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_tutor_rating'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TutorSubject',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subject', models.CharField(max_length=100)),
+                ('level', models.CharField(choices=[('HIGH_SCHOOL', 'High school'), ('BACHELOR', 'Bachelor'), ('MASTER', 'Master'), ('PHD', 'PhD')], max_length=100)),
+                ('tutor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tutor_subjects', to='accounts.Tutor')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='tutorsubject',
+            index=models.Index(fields=['subject', 'level', 'tutor'], name='tutorsubject_subject_level'),
+        ),
+        migrations.RunPython(copy_subjects_to_table, copy_subjects_to_array),
+        migrations.RemoveField(
+            model_name='tutor',
+            name='subjects',
+        ),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 2.0 on 2026-10-18 13:25
+
+import hashlib
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+from PIL import Image
+
+# Storage layout of accounts/pictures.py at the time of this migration.
+THUMBNAIL_SIZES = [64, 256]
+
+
+def store_picture(blob):
+    """Store an image and its thumbnails under its content hash, like accounts.pictures.store_picture."""
+    digest = hashlib.sha256(blob).hexdigest()
+    image = Image.open(BytesIO(blob))
+    image.load()
+    content_type = Image.MIME.get(image.format, 'application/octet-stream')
+    name = f'pictures/{digest[:2]}/{digest}.{image.format.lower()}'
+    if not default_storage.exists(name):
+        default_storage.save(name, ContentFile(blob))
+    for size in THUMBNAIL_SIZES:
+        thumbnail_name = f'{name.rsplit(".", 1)[0]}_{size}.png'
+        if default_storage.exists(thumbnail_name):
+            continue
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size))
+        if thumbnail.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            thumbnail = thumbnail.convert('RGBA')
+        buffer = BytesIO()
+        thumbnail.save(buffer, 'PNG')
+        default_storage.save(thumbnail_name, ContentFile(buffer.getvalue()))
+    return name, digest, content_type
+
+
+def move_blobs_to_storage(apps, schema_editor):
+    ProfilePicture = apps.get_model('accounts', 'ProfilePicture')
+    # Load one blob at a time instead of every picture at once.
+    for pk in ProfilePicture.objects.values_list('pk', flat=True).iterator():
+        blob = ProfilePicture.objects.filter(pk=pk).values_list('image', flat=True).get()
+        if not blob:
+            continue
+        try:
+            name, content_hash, content_type = store_picture(bytes(blob))
+        except OSError:
+            # Not an image Pillow can read; the picture is dropped.
+            continue
+        ProfilePicture.objects.filter(pk=pk).update(
+            image_file=name, content_hash=content_hash, content_type=content_type,
+        )
+
+
+def move_files_to_blobs(apps, schema_editor):
+    ProfilePicture = apps.get_model('accounts', 'ProfilePicture')
+    for picture in ProfilePicture.objects.exclude(image_file='').only('pk', 'image_file').iterator():
+        with default_storage.open(picture.image_file.name) as file:
+            ProfilePicture.objects.filter(pk=picture.pk).update(image=file.read())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_tutorsubject_trigram_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profilepicture',
+            name='image_file',
+            field=models.FileField(blank=True, max_length=255, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='profilepicture',
+            name='content_hash',
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='profilepicture',
+            name='content_type',
+            field=models.CharField(blank=True, max_length=50),
+        ),
+        migrations.AlterField(
+            model_name='profilepicture',
+            name='image',
+            field=models.BinaryField(null=True),
+        ),
+        migrations.RunPython(move_blobs_to_storage, move_files_to_blobs),
+        migrations.RemoveField(
+            model_name='profilepicture',
+            name='image',
+        ),
+        migrations.RenameField(
+            model_name='profilepicture',
+            old_name='image_file',
+            new_name='image',
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 2.0 on 2026-10-18 14:02
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0013_profilepicture_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tutor',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 2.0 on 2026-10-18 14:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_tutor_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profilepicture',
+            name='error',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='profilepicture',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('ready', 'Ready'), ('failed', 'Failed')], default='ready', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='profilepicture',
+            name='upload',
+            field=models.FileField(blank=True, max_length=255, upload_to=''),
+        ),
+    ]
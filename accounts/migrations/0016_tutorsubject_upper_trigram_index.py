@@ -0,0 +1,30 @@
+# Generated by Django 2.0 on 2026-10-18 17:10
+
+from django.db import migrations
+
+
+def create_upper_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    # Serves subject__icontains, which compiles to UPPER(subject) LIKE UPPER(%s).
+    schema_editor.execute(
+        'CREATE INDEX tutorsubject_subject_upper_trgm ON accounts_tutorsubject '
+        'USING gin ((UPPER(subject)) gin_trgm_ops)'
+    )
+
+
+def drop_upper_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS tutorsubject_subject_upper_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0015_profilepicture_processing'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_upper_trigram_index, drop_upper_trigram_index),
+    ]
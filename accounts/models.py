@@ -1,10 +1,17 @@
 import datetime
+import logging
 
 from django.contrib.auth.models import AbstractUser
-from django.contrib.postgres.fields import ArrayField
 from django.contrib.gis.db import models
+from django.db import transaction
 from django.contrib.gis.geos import Point
+from django.core.files.storage import default_storage
 
+from . import identity
+from .pictures import THUMBNAIL_SIZES, sanitize_image, save_upload, store_picture, variant_name
+from .tasks import run_in_background
+
+logger = logging.getLogger(__name__)
 
 class User(AbstractUser):
     STUDENT = 'student'
@@ -17,16 +24,79 @@ class User(AbstractUser):
 
     @property
     def profile(self):
-        if self.type == self.STUDENT:
-            return self.student
-        elif self.type == self.TUTOR:
-            return self.tutor
-        return None
+        if self.type not in (self.STUDENT, self.TUTOR):
+            return None
+        relation = self._meta.get_field(self.type)
+        if not relation.is_cached(self):
+            profile = identity.get_profile(self.pk)
+            if isinstance(profile, relation.related_model):
+                relation.set_cached_value(self, profile)
+            else:
+                identity.remember_profile(self.pk, getattr(self, self.type))
+        return getattr(self, self.type)
 
 
 class ProfilePicture(models.Model):
+    PENDING = 'pending'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (READY, 'Ready'),
+        (FAILED, 'Failed'),
+    ]
+
     user = models.OneToOneField('accounts.User', on_delete=models.CASCADE, related_name='picture')
-    image = models.BinaryField()
+    image = models.FileField(max_length=255, blank=True)
+    content_hash = models.CharField(max_length=64, blank=True)
+    content_type = models.CharField(max_length=50, blank=True)
+    # Raw upload waiting to be processed in the background.
+    upload = models.FileField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUSES, default=READY)
+    error = models.CharField(max_length=255, blank=True)
+
+    def store(self, file):
+        self.image.name, self.content_hash, self.content_type = store_picture(file)
+
+    def queue(self, file):
+        """Save an upload for background processing; the current image stays until it is done."""
+        self.upload.name = save_upload(file)
+        self.status = self.PENDING
+        self.error = ''
+        self.save()
+        run_in_background(process_picture, self.pk)
+
+    def process(self):
+        upload = self.upload.name
+        if self.status != self.PENDING or not upload:
+            return
+        try:
+            with default_storage.open(upload) as file:
+                self.store(sanitize_image(file))
+            self.status, self.error = self.READY, ''
+        except Exception as e:
+            # Pillow's decoders raise all kinds of errors on malformed files
+            # (SyntaxError, struct.error, EOFError, ...).
+            logger.exception("Processing picture %s failed", self.pk)
+            self.status, self.error = self.FAILED, str(e)[:255]
+        # A newer upload may have replaced this one in the meantime, it wins.
+        ProfilePicture.objects.filter(pk=self.pk, upload=upload).update(
+            image=self.image.name, content_hash=self.content_hash, content_type=self.content_type,
+            status=self.status, error=self.error, upload='',
+        )
+        default_storage.delete(upload)
+
+    def variant(self, size=None):
+        """Storage name and content type of the original or of the thumbnail for ``size``."""
+        if size in THUMBNAIL_SIZES:
+            return variant_name(self.image.name, size), 'image/png'
+        return self.image.name, self.content_type
+
+
+def process_picture(pk):
+    picture = ProfilePicture.objects.filter(pk=pk).first()
+    if picture is not None:
+        picture.process()
 
 
 class Profile(models.Model):
@@ -71,34 +141,79 @@ class Tutor(Profile):
     ]
 
     hourly_rate = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
-    subjects = ArrayField(
-        ArrayField(
-            models.CharField(max_length=100),
-            size=2,
-            default=list,
-        ),
-        default=list,
-    )
     available = models.BooleanField(blank=True, default=True)
+    rating = models.FloatField(default=0.0, db_index=True)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    # Bumped whenever anything in the tutor's API representation changes, see signals.py.
+    updated_at = models.DateTimeField(auto_now=True)
+
+    LEVELS = [level for level, name in LEVEL_CHOICES]
+
+    @classmethod
+    def levels_from(cls, level):
+        """All levels at or above the given level."""
+        return cls.LEVELS[cls.LEVELS.index(level):]
 
     @property
     def subject_dicts(self):
+        if '_subject_dicts' in self.__dict__:
+            return self._subject_dicts
         return list(map(
-            lambda subject: {'subject': subject[0], 'level': subject[1]},
-            self.subjects,
+            lambda subject: {'subject': subject.subject, 'level': subject.level},
+            sorted(self.tutor_subjects.all(), key=lambda subject: subject.pk),
         ))
 
     @subject_dicts.setter
     def subject_dicts(self, subject_dicts):
-        self.subjects = list(map(
-            lambda subject: [subject['subject'], subject['level']],
-            subject_dicts,
-        ))
+        self._subject_dicts = list(subject_dicts)
+
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            subject_dicts = self.__dict__.pop('_subject_dicts', None)
+            if subject_dicts is not None:
+                self.tutor_subjects.all().delete()
+                TutorSubject.objects.bulk_create([
+                    TutorSubject(tutor=self, subject=subject['subject'], level=subject['level'])
+                    for subject in subject_dicts
+                ])
+                getattr(self, '_prefetched_objects_cache', {}).pop('tutor_subjects', None)
+
+    def update_rating(self, added=None, removed=None):
+        """
+        Adjust the stored rating aggregate for a review that was added,
+        changed (both arguments) or removed. Must run inside a transaction.
+        """
+        tutor = Tutor.objects.select_for_update().get(pk=self.pk)
+        if removed is not None:
+            tutor.rating_sum -= removed
+            tutor.rating_count -= 1
+        if added is not None:
+            tutor.rating_sum += added
+            tutor.rating_count += 1
+        tutor.rating = tutor.rating_sum / tutor.rating_count if tutor.rating_count else 0.0
+        tutor.save(update_fields=['rating', 'rating_sum', 'rating_count', 'updated_at'])
+        self.rating, self.rating_sum, self.rating_count = tutor.rating, tutor.rating_sum, tutor.rating_count
 
     def __str__(self):
         return f"{self.user}"
 
 
+class TutorSubject(models.Model):
+    tutor = models.ForeignKey('accounts.Tutor', on_delete=models.CASCADE, related_name='tutor_subjects')
+    subject = models.CharField(max_length=100)
+    level = models.CharField(max_length=100, choices=Tutor.LEVEL_CHOICES)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['subject', 'level', 'tutor'], name='tutorsubject_subject_level'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} ({self.level})"
+
+
 class Location(models.Model):
     address = models.CharField(max_length=255)
     google_id = models.CharField(max_length=255)
@@ -0,0 +1,144 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.contrib.gis.measure import D
+from django.core.exceptions import ValidationError
+from django.db.models import FloatField, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination over a composite ordering key. The cursor holds the key
+    of the last row on the page, so the next page is a plain range condition
+    instead of an OFFSET scan.
+    """
+    page_size = 50
+    max_page_size = 200
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    ordering = ['pk']
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_ordering(self, queryset):
+        return self.ordering
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        return self.decode(encoded)
+
+    def decode(self, encoded):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')).decode('utf-8'))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.keys):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def encode_cursor(self, values):
+        return base64.urlsafe_b64encode(json.dumps(values).encode('utf-8')).decode('ascii')
+
+    def get_key_value(self, obj, field):
+        value = getattr(obj, field)
+        if field == 'distance' and isinstance(value, D):
+            return value.m
+        return value
+
+    def get_key_field(self, queryset, field):
+        if field == 'distance':
+            # Stored in the cursor in meters.
+            return FloatField()
+        if field in queryset.query.annotations:
+            return queryset.query.annotations[field].output_field
+        if field == 'pk':
+            return queryset.model._meta.pk
+        return queryset.model._meta.get_field(field)
+
+    def clean_cursor(self, queryset, values):
+        """The cursor's values converted to the types of their fields."""
+        cleaned = []
+        for field, value in zip(self.keys, values):
+            try:
+                value = self.get_key_field(queryset, field).to_python(value)
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+            if value is None:
+                raise NotFound(self.invalid_cursor_message)
+            cleaned.append(value)
+        return cleaned
+
+    def prepare_key_value(self, field, value):
+        if field == 'distance':
+            return D(m=value)
+        return value
+
+    def after_cursor(self, values):
+        """Lexicographic "comes after" condition for the ordering key."""
+        condition = Q()
+        equal = {}
+        for ordering, value in zip(self.ordering_fields, values):
+            field = ordering.lstrip('-')
+            value = self.prepare_key_value(field, value)
+            lookup = '%s__%s' % (field, 'lt' if ordering.startswith('-') else 'gt')
+            condition |= Q(**equal, **{lookup: value})
+            equal[field] = value
+        return condition
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.ordering_fields = self.get_ordering(queryset)
+        self.keys = [field.lstrip('-') for field in self.ordering_fields]
+        self.page_size_value = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering_fields)
+        cursor = self.decode_cursor(request)
+        if cursor is not None:
+            queryset = queryset.filter(self.after_cursor(self.clean_cursor(queryset, cursor)))
+
+        rows = list(queryset[:self.page_size_value + 1])
+        self.has_next = len(rows) > self.page_size_value
+        self.page = rows[:self.page_size_value]
+        return self.page
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        cursor = self.encode_cursor([self.get_key_value(last, field) for field in self.keys])
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+
+class TutorPagination(KeysetPagination):
+    """
+    Orders by subject match quality (when searching by subject), distance
+    (when searching by location), then rating, then pk.
+    """
+    ordering = ['-rating', 'pk']
+
+    def get_ordering(self, queryset):
+        ordering = list(self.ordering)
+        if 'distance' in queryset.query.annotations:
+            ordering.insert(0, 'distance')
+        if 'subject_rank' in queryset.query.annotations:
+            ordering.insert(0, '-subject_rank')
+        return ordering
@@ -9,7 +9,7 @@ class IsOwnerOrReadOnly(permissions.BasePermission):
             return True
         if request.user.is_superuser:
             return True
-        return obj.user == request.user
+        return obj.user_id == request.user.pk
 
 
 class IsParentOwnerOrReadOnly(permissions.BasePermission):
@@ -19,7 +19,7 @@ class IsParentOwnerOrReadOnly(permissions.BasePermission):
         if request.user.is_superuser:
             return True
         parent = view.get_parent_object()
-        return parent.user == request.user
+        return parent.user_id == request.user.pk
 
 
 class IsStudent(permissions.IsAuthenticated):
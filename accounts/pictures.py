@@ -0,0 +1,94 @@
+import hashlib
+import posixpath
+import uuid
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile, File
+from django.core.files.storage import default_storage
+from django.http import FileResponse, HttpResponse
+from PIL import Image, ImageOps
+
+THUMBNAIL_SIZES = [64, 256]
+ALLOWED_FORMATS = {'JPEG', 'PNG', 'GIF', 'WEBP'}
+CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(file):
+    digest = hashlib.sha256()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+        digest.update(chunk)
+    file.seek(0)
+    return digest.hexdigest()
+
+
+def picture_name(digest, extension):
+    return f'pictures/{digest[:2]}/{digest}.{extension}'
+
+
+def variant_name(name, size):
+    """Storage name of the thumbnail of ``name`` that fits in a ``size`` px square."""
+    base, extension = posixpath.splitext(name)
+    return f'{base}_{size}.png'
+
+
+def save_upload(file):
+    """Stream a raw upload into storage until it is processed."""
+    return default_storage.save(f'pictures/uploads/{uuid.uuid4().hex}', File(file))
+
+
+def sanitize_image(file):
+    """
+    Validate an uploaded image and re-encode it, applying and then dropping
+    the EXIF orientation along with all other metadata.
+    """
+    image = Image.open(file)
+    image_format = image.format
+    if image_format not in ALLOWED_FORMATS:
+        raise ValueError(f'Unsupported image format: {image_format}')
+    image = ImageOps.exif_transpose(image)
+    buffer = BytesIO()
+    image.save(buffer, image_format, **({'quality': 90} if image_format == 'JPEG' else {}))
+    buffer.seek(0)
+    return buffer
+
+
+def store_picture(file):
+    """
+    Store an uploaded image under its content hash together with its
+    thumbnails. Identical uploads share the same files. Returns the storage
+    name, the hash and the detected content type.
+    """
+    digest = content_hash(file)
+    image = Image.open(file)
+    image.load()
+    content_type = Image.MIME.get(image.format, 'application/octet-stream')
+    name = picture_name(digest, image.format.lower())
+    if not default_storage.exists(name):
+        file.seek(0)
+        default_storage.save(name, File(file))
+    for size in THUMBNAIL_SIZES:
+        thumbnail_name = variant_name(name, size)
+        if default_storage.exists(thumbnail_name):
+            continue
+        thumbnail = image.copy()
+        thumbnail.thumbnail((size, size))
+        if thumbnail.mode not in ('RGB', 'RGBA', 'L', 'LA'):
+            thumbnail = thumbnail.convert('RGBA')
+        buffer = BytesIO()
+        thumbnail.save(buffer, 'PNG')
+        default_storage.save(thumbnail_name, ContentFile(buffer.getvalue()))
+    return name, digest, content_type
+
+
+def picture_response(name, content_type):
+    """
+    Serve a stored picture without reading it into memory: either hand it to
+    the web server with X-Accel-Redirect or stream it from storage.
+    """
+    if settings.PICTURE_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.PICTURE_ACCEL_REDIRECT + name
+        return response
+    return FileResponse(default_storage.open(name), content_type=content_type)
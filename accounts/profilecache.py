@@ -0,0 +1,52 @@
+"""
+Cache of the serialized own-profile payload (``/api/users/profile/``). Each
+user has a version key; anything that changes what their profile shows bumps
+it, so stale payloads are never read and simply expire. Payloads are built
+every time unless ``CACHE_USER_DATA`` is set.
+"""
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+TIMEOUT = 24 * 60 * 60
+
+
+def version_key(user_pk):
+    return f'profile:{user_pk}:version'
+
+
+def get_version(user_pk):
+    version = cache.get(version_key(user_pk))
+    if version is None:
+        cache.add(version_key(user_pk), uuid.uuid4().hex, None)
+        version = cache.get(version_key(user_pk))
+    return version
+
+
+def get_or_build(user_pk, build):
+    """The cached payload of ``user_pk``, calling ``build()`` on a miss."""
+    if not settings.CACHE_USER_DATA:
+        return build()
+    # Read the version first: if the profile changes while building, the
+    # payload is stored under a version that is already outdated.
+    key = f'profile:{user_pk}:{get_version(user_pk)}'
+    data = cache.get(key)
+    if data is None:
+        data = build()
+        cache.set(key, data, TIMEOUT)
+    return data
+
+
+def invalidate(user_pks):
+    cache.set_many({version_key(pk): uuid.uuid4().hex for pk in user_pks}, None)
+
+
+def invalidate_on_commit(user_pks):
+    """
+    Invalidate right away and once more after the transaction commits, so a
+    payload built from the not yet committed state meanwhile is dropped too.
+    """
+    invalidate(user_pks)
+    transaction.on_commit(lambda: invalidate(user_pks))
@@ -0,0 +1,128 @@
+"""
+Read-only fast path for the tutor search and profile payloads. Builds the
+same data as TutorSerializer, StudentSerializer and their nested serializers
+straight from prefetched instances instead of going through a DRF field per
+value. Dates of birth and hourly rates, whose formatting depends on settings,
+are still formatted by the serializers' own fields, once per distinct value.
+"""
+import json
+
+from rest_framework.compat import LONG_SEPARATORS, SHORT_SEPARATORS
+from rest_framework.renderers import JSONRenderer
+
+from .serializers import TutorSerializer
+
+DATE_OF_BIRTH_FIELD = TutorSerializer._declared_fields['date_of_birth']
+HOURLY_RATE_FIELD = TutorSerializer._declared_fields['hourly_rate']
+
+
+class Representer:
+    """Representations for one response; caches the formatted values it has seen."""
+
+    def __init__(self):
+        self.dates = {}
+        self.rates = {}
+
+    def date_of_birth(self, profile):
+        date = profile.date_of_birth
+        if date not in self.dates:
+            self.dates[date] = DATE_OF_BIRTH_FIELD.to_representation(profile.date_of_birth_datetime)
+        return self.dates[date]
+
+    def hourly_rate(self, tutor):
+        rate = tutor.hourly_rate
+        if rate is None:
+            return None
+        if rate not in self.rates:
+            self.rates[rate] = HOURLY_RATE_FIELD.to_representation(rate)
+        return self.rates[rate]
+
+    def locations(self, profile):
+        return [{
+            'pk': location.pk,
+            'address': location.address,
+            'google_id': location.google_id,
+            'latitude': float(location.latitude),
+            'longitude': float(location.longitude),
+        } for location in profile.locations.all()]
+
+    def nested_tutor(self, tutor):
+        return {
+            'pk': tutor.pk,
+            'username': tutor.user.username,
+            'date_of_birth': self.date_of_birth(tutor),
+            'gender': tutor.gender,
+            'hourly_rate': self.hourly_rate(tutor),
+            'subjects': tutor.subject_dicts,
+            'available': tutor.available,
+            'locations': self.locations(tutor),
+            'rating': float(tutor.rating),
+        }
+
+    def nested_student(self, student):
+        return {
+            'pk': student.pk,
+            'username': student.user.username,
+            'date_of_birth': self.date_of_birth(student),
+            'gender': student.gender,
+            'locations': self.locations(student),
+        }
+
+    def tutor(self, tutor):
+        return {
+            'pk': tutor.pk,
+            'username': tutor.user.username,
+            'date_of_birth': self.date_of_birth(tutor),
+            'gender': tutor.gender,
+            'hourly_rate': self.hourly_rate(tutor),
+            'subjects': tutor.subject_dicts,
+            'available': tutor.available,
+            'students': [self.nested_student(student) for student in tutor.students.all()],
+            'locations': self.locations(tutor),
+            'rating': float(tutor.rating),
+        }
+
+    def student(self, student):
+        return {
+            'pk': student.pk,
+            'username': student.user.username,
+            'date_of_birth': self.date_of_birth(student),
+            'gender': student.gender,
+            'tutors': [self.nested_tutor(tutor) for tutor in student.tutors.all()],
+            'locations': self.locations(student),
+        }
+
+
+def represent_tutors(tutors):
+    """``TutorSerializer(tutors, many=True).data``, for tutors from ``TutorViewSet.queryset``."""
+    representer = Representer()
+    return [representer.tutor(tutor) for tutor in tutors]
+
+
+def represent_tutor(tutor):
+    return Representer().tutor(tutor)
+
+
+def represent_student(student):
+    """``StudentSerializer(student).data``, for a student from ``StudentViewSet.queryset``."""
+    return Representer().student(student)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    Renders the same bytes as JSONRenderer, but without the circular reference
+    checks of the encoder, which large plain payloads spend a lot of time on.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        encoder = json.JSONEncoder(
+            ensure_ascii=self.ensure_ascii,
+            allow_nan=not self.strict,
+            separators=SHORT_SEPARATORS if self.compact else LONG_SEPARATORS,
+            check_circular=False,
+            default=self.encoder_class().default,
+        )
+        ret = encoder.encode(data)
+        return ret.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode('utf-8')
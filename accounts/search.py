@@ -0,0 +1,67 @@
+"""
+Fuzzy subject search. On PostgreSQL this uses pg_trgm (see migrations
+0012_tutorsubject_trigram_index and 0016_tutorsubject_upper_trigram_index,
+which serve the similarity and the substring match), elsewhere the same trigram similarity is
+computed in Python so test databases rank results identically.
+"""
+import re
+from collections import defaultdict
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, FloatField, OuterRef, Q, Subquery, Value, When
+
+from .models import TutorSubject
+
+# Same default as pg_trgm.similarity_threshold, which the % operator uses.
+SIMILARITY_THRESHOLD = 0.3
+
+
+def trigrams(text):
+    """Trigrams of ``text`` the way pg_trgm's show_trgm() extracts them."""
+    result = set()
+    for word in re.findall(r'[^\W_]+', text.lower()):
+        padded = f'  {word} '
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return result
+
+
+def similarity(a, b):
+    """Python equivalent of pg_trgm's similarity()."""
+    a, b = trigrams(a), trigrams(b)
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def rank_tutors(queryset, query):
+    """
+    Restrict ``queryset`` to tutors with a subject resembling ``query`` and
+    annotate each with the best similarity as ``subject_rank``.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        matches = TutorSubject.objects.filter(Q(subject__trigram_similar=query) | Q(subject__icontains=query))
+        best = TutorSubject.objects.filter(tutor=OuterRef('pk')).annotate(
+            similarity=TrigramSimilarity('subject', query),
+        ).order_by('-similarity').values('similarity')[:1]
+        return queryset.filter(pk__in=matches.values('tutor_id')).annotate(
+            subject_rank=Subquery(best, output_field=FloatField()),
+        )
+
+    ranks = {}
+    lowered = query.lower()
+    for tutor_id, subject in TutorSubject.objects.values_list('tutor_id', 'subject').iterator():
+        score = similarity(query, subject)
+        if score >= SIMILARITY_THRESHOLD or lowered in subject.lower():
+            ranks[tutor_id] = max(ranks.get(tutor_id, 0.0), score)
+    # One branch per distinct rank rather than per matching tutor.
+    tutors_by_rank = defaultdict(list)
+    for tutor_id, rank in ranks.items():
+        tutors_by_rank[rank].append(tutor_id)
+    return queryset.filter(pk__in=list(ranks)).annotate(
+        subject_rank=Case(
+            *[When(pk__in=tutor_ids, then=Value(rank)) for rank, tutor_ids in tutors_by_rank.items()],
+            default=Value(0.0),
+            output_field=FloatField(),
+        ),
+    )
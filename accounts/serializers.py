@@ -28,22 +28,21 @@ class LocationSerializer(serializers.ModelSerializer):
 
 
 class ProfilePictureSerializer(serializers.ModelSerializer):
-    image = serializers.ImageField()
+    # Validated and re-encoded in the background, see ProfilePicture.process.
+    image = serializers.FileField(write_only=True)
+    status = serializers.CharField(read_only=True)
 
     def create(self, validated_data):
         image, _ = ProfilePicture.objects.get_or_create(user=self.context['request'].user)
-        image.image = validated_data['image'].read()
-        image.save()
-        return image
+        return self.update(image, validated_data)
 
     def update(self, instance, validated_data):
-        instance.image = validated_data['image'].read()
-        instance.save()
+        instance.queue(validated_data['image'])
         return instance
 
     class Meta:
         model = ProfilePicture
-        fields = ['image']
+        fields = ['image', 'status']
 
 
 class NestedTutorSerializer(serializers.ModelSerializer):
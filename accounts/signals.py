@@ -0,0 +1,173 @@
+from django.db.models import Q
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from django.utils import timezone
+
+from . import authentication, geocache, profilecache
+from .models import Location, ProfilePicture, Student, Tutor, TutorSubject, User
+
+# Tutor fields that location search candidates depend on.
+SEARCH_FIELDS = {'available', 'hourly_rate'}
+
+
+def touch_tutors(*args, **kwargs):
+    """Mark tutors as changed, e.g. for conditional requests on their detail route."""
+    Tutor.objects.filter(*args, **kwargs).update(updated_at=timezone.now())
+
+
+def invalidate_profiles(tutors=None, students=None):
+    """
+    Drop the cached profiles showing the matching tutors or students: their
+    own and those of the students or tutors they are linked to.
+    """
+    condition = Q(pk__in=[])
+    if tutors is not None:
+        tutors = Tutor.objects.filter(tutors)
+        condition |= Q(tutor__in=tutors) | Q(student__tutors__in=tutors)
+    if students is not None:
+        students = Student.objects.filter(students)
+        condition |= Q(student__in=students) | Q(tutor__students__in=students)
+    user_pks = set(User.objects.filter(condition).values_list('pk', flat=True))
+    profilecache.invalidate_on_commit(user_pks)
+
+
+@receiver(post_save, sender=Tutor)
+def tutor_saved(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or SEARCH_FIELDS & set(update_fields):
+        geocache.invalidate_on_commit()
+    invalidate_profiles(tutors=Q(pk=instance.pk))
+
+
+@receiver(pre_delete, sender=Tutor)
+def tutor_deleted(sender, instance, **kwargs):
+    invalidate_profiles(tutors=Q(pk=instance.pk))
+
+
+@receiver(post_delete, sender=Tutor)
+def search_data_changed(sender, **kwargs):
+    geocache.invalidate_on_commit()
+
+
+@receiver(post_save, sender=TutorSubject)
+@receiver(post_delete, sender=TutorSubject)
+def tutor_subject_changed(sender, instance, **kwargs):
+    geocache.invalidate_on_commit()
+    touch_tutors(pk=instance.tutor_id)
+    invalidate_profiles(tutors=Q(pk=instance.tutor_id))
+
+
+@receiver(post_save, sender=Location)
+@receiver(pre_delete, sender=Location)
+def location_changed(sender, instance, **kwargs):
+    # Locations of students and meetings are not part of the search. A new
+    # location only matters once it is added to a tutor, see below.
+    if Tutor.locations.through.objects.filter(location_id=instance.pk).exists():
+        geocache.invalidate_on_commit()
+    touch_tutors(Q(locations=instance) | Q(students__locations=instance))
+    invalidate_profiles(tutors=Q(locations=instance), students=Q(locations=instance))
+
+
+@receiver(m2m_changed, sender=Tutor.locations.through)
+def tutor_locations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        geocache.invalidate_on_commit()
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'pre_clear'):
+            touch_tutors(pk=instance.pk)
+            invalidate_profiles(tutors=Q(pk=instance.pk))
+    elif action in ('post_add', 'post_remove'):
+        touch_tutors(pk__in=pk_set)
+        invalidate_profiles(tutors=Q(pk__in=pk_set))
+    elif action == 'pre_clear':
+        touch_tutors(locations=instance)
+        invalidate_profiles(tutors=Q(locations=instance))
+
+
+@receiver(m2m_changed, sender=Student.locations.through)
+def student_locations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'pre_clear'):
+            touch_tutors(students=instance)
+            invalidate_profiles(students=Q(pk=instance.pk))
+    elif action in ('post_add', 'post_remove'):
+        touch_tutors(students__pk__in=pk_set)
+        invalidate_profiles(students=Q(pk__in=pk_set))
+    elif action == 'pre_clear':
+        touch_tutors(students__locations=instance)
+        invalidate_profiles(students=Q(locations=instance))
+
+
+@receiver(m2m_changed, sender=Student.tutors.through)
+def student_tutors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        if action in ('post_add', 'post_remove', 'pre_clear'):
+            touch_tutors(pk=instance.pk)
+        if action in ('post_add', 'post_remove'):
+            invalidate_profiles(tutors=Q(pk=instance.pk), students=Q(pk__in=pk_set))
+        elif action == 'pre_clear':
+            invalidate_profiles(tutors=Q(pk=instance.pk))
+    elif action in ('post_add', 'post_remove'):
+        touch_tutors(pk__in=pk_set)
+        invalidate_profiles(tutors=Q(pk__in=pk_set), students=Q(pk=instance.pk))
+    elif action == 'pre_clear':
+        touch_tutors(students=instance)
+        invalidate_profiles(students=Q(pk=instance.pk))
+
+
+@receiver(post_save, sender=Student)
+def student_saved(sender, instance, **kwargs):
+    touch_tutors(students=instance)
+    invalidate_profiles(students=Q(pk=instance.pk))
+
+
+@receiver(pre_delete, sender=Student)
+def student_deleted(sender, instance, **kwargs):
+    invalidate_profiles(students=Q(pk=instance.pk))
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created:
+        return
+    if update_fields is None or 'type' in update_fields:
+        # The profile route answers with the profile of the user's type.
+        profilecache.invalidate_on_commit([instance.pk])
+    # Only the username is part of the tutor representation.
+    if update_fields is not None and 'username' not in update_fields:
+        return
+    touch_tutors(Q(user=instance) | Q(students__user=instance))
+    invalidate_profiles(tutors=Q(user=instance), students=Q(user=instance))
+
+
+@receiver(post_save, sender=ProfilePicture)
+@receiver(post_delete, sender=ProfilePicture)
+def picture_changed(sender, instance, **kwargs):
+    profilecache.invalidate_on_commit([instance.user_id])
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(sender, instance, **kwargs):
+    authentication.invalidate_key(instance.key)
+
+
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+@receiver(post_save, sender=Tutor)
+@receiver(post_delete, sender=Tutor)
+def profile_changed(sender, instance, **kwargs):
+    # Authenticated users are cached together with their profile.
+    authentication.invalidate_user(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    if not created and update_fields != frozenset(['last_login']):
+        authentication.invalidate_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def logged_out(sender, user, **kwargs):
+    if user is not None:
+        authentication.invalidate_user(user.pk)
@@ -0,0 +1,35 @@
+"""
+Minimal in-process background jobs. Jobs run on a thread pool owned by the
+worker process once the surrounding transaction commits; anything they need
+to survive a restart must be recorded in the database by the caller.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.BACKGROUND_WORKERS)
+    return _executor
+
+
+def _run(func, args):
+    try:
+        func(*args)
+    except Exception:
+        logger.exception("Background job %s failed", func.__qualname__)
+    finally:
+        # Pool threads get their own connections; don't leave them open.
+        connections.close_all()
+
+
+def run_in_background(func, *args):
+    transaction.on_commit(lambda: get_executor().submit(_run, func, args))
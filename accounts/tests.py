@@ -1,10 +1,32 @@
 import datetime
+import shutil
+import tempfile
 from decimal import Decimal
+from io import BytesIO
+from unittest import mock, skipUnless
 
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.db import connection, connections
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIClient
 
-from .models import Profile, Student, Tutor, User
+from findmytutor.replicas import ReplicaRouter, is_sticky, primary, set_replicas_enabled
+from . import geocache, identity
+from .authentication import CachedTokenAuthentication
+from .backends import ModelBackend
+from .models import Profile, ProfilePicture, Student, Tutor, TutorSubject, User
+from .pagination import TutorPagination
+from .representations import FastJSONRenderer, represent_student, represent_tutors
+from .serializers import StudentSerializer, TutorSerializer
+from .views import StudentViewSet, TutorViewSet
 
 
 class AccountsTestCase(APITestCase):
@@ -29,6 +51,9 @@ class AccountsTestCase(APITestCase):
             latitude=51.441642,
         )
 
+    def setUp(self):
+        cache.clear()
+
     def test_root_api_view(self):
         response = self.client.get('/api/')
         self.assertEqual(response.status_code, 200)
@@ -40,7 +65,7 @@ class AccountsTestCase(APITestCase):
     def test_list_students(self):
         response = self.client.get(reverse('student-list'))
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        data = response.json()['results']
         self.assertEqual(len(data), 1)
         student = data[0]
         self.assertEqual(student['username'], 'student')
@@ -52,7 +77,7 @@ class AccountsTestCase(APITestCase):
     def test_list_tutors(self):
         response = self.client.get(reverse('tutor-list'))
         self.assertEqual(response.status_code, 200)
-        data = response.json()
+        data = response.json()['results']
         self.assertEqual(len(data), 1)
         tutor = data[0]
         self.assertEqual(tutor['username'], 'tutor')
@@ -197,12 +222,12 @@ class AccountsTestCase(APITestCase):
         }
         response = self.client.get(reverse('tutor-search'), data=data, format='json')
         self.assertEqual(response.status_code, 200)
-        json = response.json()
+        json = response.json()['results']
         self.assertEqual(len(json), 1)
         data['location'] = "4.899651,52.377687"
         response = self.client.get(reverse('tutor-search'), data=data, format='json')
         self.assertEqual(response.status_code, 200)
-        json = response.json()
+        json = response.json()['results']
         self.assertEqual(len(json), 0)
 
     def test_get_profile(self):
@@ -213,3 +238,431 @@ class AccountsTestCase(APITestCase):
         data = response.json()
         self.assertEqual(data['username'], 'student')
         self.assertEqual(data['type'], 'student')
+
+    @override_settings(CACHE_USER_DATA=True)
+    def test_profile_is_cached(self):
+        student = self.student.profile
+        tutor = self.tutor.profile
+        student.tutors.add(tutor)
+        client = APIClient()
+        client.force_authenticate(user=self.student)
+        data = client.get(reverse('user-profile')).json()
+        self.assertEqual(data['tutors'][0]['rating'], 0.0)
+        with self.assertNumQueries(0):
+            self.assertEqual(client.get(reverse('user-profile')).json(), data)
+
+        tutor.update_rating(added=4)
+        data = client.get(reverse('user-profile')).json()
+        self.assertEqual(data['tutors'][0]['rating'], 4.0)
+
+        student.locations.create(address='Stationsplein 1', google_id='station', latitude=51.44, longitude=5.48)
+        data = client.get(reverse('user-profile')).json()
+        self.assertEqual([location['address'] for location in data['locations']], ['Stationsplein 1'])
+
+        client.force_authenticate(user=self.tutor)
+        data = client.get(reverse('user-profile')).json()
+        self.assertEqual(data['students'][0]['locations'][0]['address'], 'Stationsplein 1')
+
+    @override_settings(CACHE_USER_DATA=True)
+    def test_cached_token_authentication(self):
+        token = Token.objects.create(user=self.tutor)
+        authentication = CachedTokenAuthentication()
+        user, auth = authentication.authenticate_credentials(token.key)
+        self.assertEqual(user, self.tutor)
+        with self.assertNumQueries(0):
+            user, auth = authentication.authenticate_credentials(token.key)
+            self.assertEqual(user.profile.pk, self.tutor.tutor.pk)
+
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+        client.get(reverse('user-profile'))
+        with self.assertNumQueries(0):
+            response = client.get(reverse('user-profile'))
+        self.assertEqual(response.json()['type'], User.TUTOR)
+
+        self.tutor.tutor.delete()
+        self.tutor.refresh_from_db()
+        self.tutor.type = ''
+        self.tutor.save(update_fields=['type'])
+        user, auth = authentication.authenticate_credentials(token.key)
+        self.assertIsNone(user.profile)
+
+        token.delete()
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate_credentials(token.key)
+
+    def test_user_data_not_cached_per_process(self):
+        token = Token.objects.create(user=self.tutor)
+        authentication = CachedTokenAuthentication()
+        with override_settings(CACHE_USER_DATA=True):
+            authentication.authenticate_credentials(token.key)
+        # Another process can't have dropped what this one cached.
+        with override_settings(CACHE_USER_DATA=False), self.assertNumQueries(1):
+            user, auth = authentication.authenticate_credentials(token.key)
+        self.assertEqual(user, self.tutor)
+
+    def test_profile_preloaded_and_shared_within_request(self):
+        user = ModelBackend().get_user(self.student.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.profile.pk, self.student.student.pk)
+
+        with identity.scope():
+            identity.remember(ModelBackend().get_user(self.tutor.pk))
+            other = User.objects.get(pk=self.tutor.pk)
+            with self.assertNumQueries(0):
+                self.assertEqual(other.profile.pk, self.tutor.tutor.pk)
+        other = User.objects.get(pk=self.tutor.pk)
+        with self.assertNumQueries(1):
+            other.profile
+            other.profile
+
+    def test_search_query_count_is_constant(self):
+        def search():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('tutor-search'))
+            self.assertEqual(response.status_code, 200)
+            return len(response.json()['results']), len(queries)
+
+        def add_tutor(i):
+            user = User.objects.create_user(f'tutor{i}', f'tutor{i}@example.com', type=User.TUTOR)
+            tutor = Tutor.objects.create(user=user, date_of_birth=datetime.date(1990, 1, 1), hourly_rate='20.00')
+            tutor.locations.create(address=f'Street {i}', google_id=f'tutor{i}', latitude=51.44, longitude=5.47)
+            tutor.students.add(self.student.student)
+
+        add_tutor(0)
+        results, queries = search()
+        for i in range(1, 6):
+            add_tutor(i)
+        more_results, more_queries = search()
+        self.assertEqual(more_results, results + 5)
+        self.assertEqual(more_queries, queries)
+
+    def test_search_cursor_pagination(self):
+        for i, rating in enumerate([4.0, 4.0, 2.5]):
+            user = User.objects.create_user(f'rated{i}', f'rated{i}@example.com', type=User.TUTOR)
+            Tutor.objects.create(user=user, date_of_birth=datetime.date(1990, 1, 1), rating=rating)
+
+        seen = []
+        url = reverse('tutor-search') + '?page_size=2'
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.json()
+            self.assertLessEqual(len(data['results']), 2)
+            seen.extend(data['results'])
+            url = data['next']
+        ratings = [tutor['rating'] for tutor in seen]
+        self.assertEqual(ratings, sorted(ratings, reverse=True))
+        self.assertEqual(len(seen), len({tutor['pk'] for tutor in seen}))
+        self.assertEqual(len(seen), Tutor.objects.filter(available=True).count())
+
+        response = self.client.get(reverse('tutor-search'), data={'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+        for values in (['high', 1], [4.0, 'x'], [None, 1], [4.0, [1]]):
+            cursor = TutorPagination().encode_cursor(values)
+            response = self.client.get(reverse('tutor-search'), data={'cursor': cursor})
+            self.assertEqual(response.status_code, 404)
+
+    def test_filter_subject_level(self):
+        for username, level in [('bachelor', Tutor.BACHELOR), ('phd', Tutor.PHD)]:
+            user = User.objects.create_user(username, f'{username}@example.com', type=User.TUTOR)
+            Tutor.objects.create(
+                user=user, date_of_birth=datetime.date(1990, 1, 1),
+                subject_dicts=[{'subject': 'Calculus', 'level': level}, {'subject': 'Physics', 'level': Tutor.BACHELOR}],
+            )
+        tutor = Tutor.objects.get(user__username='phd')
+        self.assertEqual(tutor.subject_dicts, [
+            {'subject': 'Calculus', 'level': Tutor.PHD},
+            {'subject': 'Physics', 'level': Tutor.BACHELOR},
+        ])
+
+        response = self.client.get(reverse('tutor-search'), data={'subject': 'Calculus', 'level': Tutor.MASTER})
+        self.assertEqual([t['username'] for t in response.json()['results']], ['phd'])
+        response = self.client.get(reverse('tutor-search'), data={'subject': 'Physics', 'level': Tutor.MASTER})
+        self.assertEqual(response.json()['results'], [])
+        response = self.client.get(reverse('tutor-search'), data={'subject': 'Calculus'})
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_subject_search(self):
+        for username, subject in [('maths', 'Mathematics'), ('math', 'Math'), ('bio', 'Biology')]:
+            user = User.objects.create_user(username, f'{username}@example.com', type=User.TUTOR)
+            Tutor.objects.create(
+                user=user, date_of_birth=datetime.date(1990, 1, 1),
+                subject_dicts=[{'subject': subject, 'level': Tutor.BACHELOR}],
+            )
+        response = self.client.get(reverse('tutor-search'), data={'subject_search': 'math'})
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([t['username'] for t in results], ['math', 'maths'])
+
+    def test_filter_location_radius(self):
+        user = User.objects.create_user('nearby', 'nearby@example.com', type=User.TUTOR)
+        tutor = Tutor.objects.create(user=user, date_of_birth=datetime.date(1990, 1, 1))
+        # Two locations in Eindhoven: the tutor must still be returned once.
+        tutor.locations.create(address='Stationsplein 1', google_id='a', latitude=51.4433, longitude=5.4813)
+        tutor.locations.create(address='Markt 1', google_id='b', latitude=51.4381, longitude=5.4780)
+        amsterdam = "4.899651,52.377687"
+        response = self.client.get(reverse('tutor-search'), data={'location': amsterdam})
+        self.assertNotIn('nearby', [t['username'] for t in response.json()['results']])
+
+        response = self.client.get(reverse('tutor-search'), data={'location': amsterdam, 'radius': 150})
+        usernames = [t['username'] for t in response.json()['results']]
+        self.assertEqual(usernames.count('nearby'), 1)
+
+        eindhoven = "5.4813,51.4433"
+        response = self.client.get(reverse('tutor-search'), data={'location': eindhoven, 'radius': 0})
+        self.assertIn('nearby', [t['username'] for t in response.json()['results']])
+        response = self.client.get(reverse('tutor-search'), data={'location': "5.4813,51.5433", 'radius': 0})
+        self.assertNotIn('nearby', [t['username'] for t in response.json()['results']])
+
+    def test_location_search_cache(self):
+        user = User.objects.create_user('cached', 'cached@example.com', type=User.TUTOR)
+        tutor = Tutor.objects.create(user=user, date_of_birth=datetime.date(1990, 1, 1))
+        tutor.locations.create(address='Stationsplein 1', google_id='a', latitude=51.4433, longitude=5.4813)
+        self.assertEqual(geocache.encode(51.44301, 5.48101), geocache.encode(51.44305, 5.48105))
+
+        def search(location):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(reverse('tutor-search'), data={'location': location})
+            return [t['username'] for t in response.json()['results']], len(queries)
+
+        usernames, cold_queries = search('5.48101,51.44301')
+        self.assertIn('cached', usernames)
+        usernames, warm_queries = search('5.48105,51.44305')
+        self.assertIn('cached', usernames)
+        self.assertEqual(warm_queries, cold_queries - 1)
+
+        tutor.available = False
+        tutor.save(update_fields=['available'])
+        usernames, queries = search('5.48105,51.44305')
+        self.assertNotIn('cached', usernames)
+
+    def test_retrieve_tutor_conditional(self):
+        tutor = self.tutor.tutor
+        url = reverse('tutor-detail', kwargs={'pk': tutor.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.student.student.tutors.add(tutor)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(len(response.json()['students']), 1)
+
+        etag = response['ETag']
+        TutorSubject.objects.create(tutor=tutor, subject='Maths', level=Tutor.PHD)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([subject['subject'] for subject in response.json()['subjects']], ['Maths'])
+
+        response = self.client.get('/api/tutors/abc/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_fast_representations_match_serializers(self):
+        user = User.objects.create_user('tut\u00f6r \u2028 "2"', 'other@example.com', type=User.TUTOR)
+        other = Tutor.objects.create(
+            user=user, date_of_birth=datetime.date(1990, 1, 2), hourly_rate=None, rating=4.25,
+        )
+        other.locations.create(
+            address='Stra\u00dfe 1\u2029', google_id='place', longitude=5.5, latitude=51.25,
+        )
+        TutorSubject.objects.create(tutor=self.tutor.tutor, subject='Maths', level=Tutor.PHD)
+        TutorSubject.objects.create(tutor=other, subject='Physics', level=Tutor.BACHELOR)
+        student = self.student.student
+        student.tutors.add(self.tutor.tutor, other)
+        student.locations.create(
+            address='Home', google_id='home', longitude=5.4, latitude=51.4,
+        )
+
+        tutors = list(TutorViewSet.queryset.order_by('pk'))
+        self.assertEqual(
+            FastJSONRenderer().render(represent_tutors(tutors)),
+            JSONRenderer().render(TutorSerializer(tutors, many=True).data),
+        )
+        student = StudentViewSet.queryset.get(pk=student.pk)
+        self.assertEqual(
+            FastJSONRenderer().render(represent_student(student)),
+            JSONRenderer().render(StudentSerializer(student).data),
+        )
+        self.assertEqual(
+            FastJSONRenderer().render(represent_student(student), 'application/json; indent=2'),
+            JSONRenderer().render(StudentSerializer(student).data, 'application/json; indent=2'),
+        )
+
+    @override_settings(DATABASE_REPLICAS=['replica1'])
+    def test_replica_router(self):
+        router = ReplicaRouter()
+        self.assertEqual(router.db_for_read(Tutor), 'default')
+        set_replicas_enabled(True)
+        try:
+            self.assertEqual(router.db_for_read(Tutor), 'replica1')
+            self.assertEqual(router.db_for_write(Tutor), 'default')
+            with primary():
+                self.assertEqual(router.db_for_read(Tutor), 'default')
+            self.assertEqual(router.db_for_read(Tutor), 'replica1')
+        finally:
+            set_replicas_enabled(False)
+        self.assertFalse(router.allow_migrate('replica1', 'accounts'))
+        self.assertTrue(router.allow_migrate('default', 'accounts'))
+
+    def test_writes_make_reads_sticky(self):
+        client = APIClient()
+        client.force_authenticate(user=self.student)
+        client.get(reverse('tutor-search'))
+        self.assertFalse(is_sticky(self.student))
+        client.post(reverse('tutor-my-tutors', kwargs={'pk': self.tutor.tutor.pk}))
+        self.assertTrue(is_sticky(self.student))
+        self.assertFalse(is_sticky(self.tutor))
+
+    @skipUnless(settings.DATABASE_REPLICAS, 'Set DATABASE_REPLICA_URLS to route reads to a second connection.')
+    def test_reads_use_replica(self):
+        replica = connections[settings.DATABASE_REPLICAS[0]]
+        client = APIClient()
+        client.force_authenticate(user=self.student)
+
+        def search():
+            with CaptureQueriesContext(connection) as primary_queries, \
+                    CaptureQueriesContext(replica) as replica_queries:
+                response = client.get(reverse('tutor-search'))
+            self.assertEqual(response.status_code, 200)
+            return len(primary_queries), len(replica_queries)
+
+        with override_settings(DATABASE_REPLICAS=settings.DATABASE_REPLICAS[:1]):
+            primary_count, replica_count = search()
+            self.assertEqual(primary_count, 0)
+            self.assertGreater(replica_count, 0)
+
+            client.post(reverse('tutor-my-tutors', kwargs={'pk': self.tutor.tutor.pk}))
+            primary_count, replica_count = search()
+            self.assertGreater(primary_count, 0)
+            self.assertEqual(replica_count, 0)
+
+
+class ProfilePictureTestCase(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('tutor', 'tutor@example.com', type=User.TUTOR)
+        cls.tutor = Tutor.objects.create(user=cls.user, date_of_birth=datetime.date(1999, 12, 31))
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, PICTURE_ACCEL_REDIRECT='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def upload(self, color='red', size=(300, 200)):
+        buffer = BytesIO()
+        Image.new('RGB', size, color).save(buffer, 'JPEG')
+        buffer.seek(0)
+        buffer.name = 'picture.jpg'
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('tutor-picture', kwargs={'pk': self.tutor.pk})
+        response = client.post(url, data={'image': buffer}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+        # Background jobs only start on commit, which never happens in a TestCase.
+        ProfilePicture.objects.get(user=self.user).process()
+        return url
+
+    def test_upload_and_download(self):
+        url = self.upload()
+        picture = ProfilePicture.objects.get(user=self.user)
+        self.assertEqual(len(picture.content_hash), 64)
+        self.assertEqual(picture.content_type, 'image/jpeg')
+        self.assertIn(picture.content_hash, picture.image.name)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(Image.open(BytesIO(b''.join(response.streaming_content))).size, (300, 200))
+
+        response = self.client.get(url, data={'size': 64})
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(Image.open(BytesIO(b''.join(response.streaming_content))).size[0], 64)
+
+    def test_accel_redirect(self):
+        url = self.upload()
+        picture = ProfilePicture.objects.get(user=self.user)
+        with self.settings(PICTURE_ACCEL_REDIRECT='/protected-media/'):
+            response = self.client.get(url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + picture.image.name)
+        self.assertEqual(response.content, b'')
+
+    def test_conditional_download(self):
+        url = self.upload()
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertIn('max-age', response['Cache-Control'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(url, data={'size': 64}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        self.upload(color='blue')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_processing_state(self):
+        client = APIClient()
+        client.force_authenticate(user=self.user)
+        url = reverse('tutor-picture', kwargs={'pk': self.tutor.pk})
+        buffer = BytesIO(b'not an image')
+        buffer.name = 'picture.jpg'
+        response = client.post(url, data={'image': buffer}, format='multipart')
+        self.assertEqual(response.status_code, 202)
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json(), {'status': 'processing'})
+
+        picture = ProfilePicture.objects.get(user=self.user)
+        picture.process()
+        picture.refresh_from_db()
+        self.assertEqual(picture.status, ProfilePicture.FAILED)
+        self.assertEqual(picture.upload.name, '')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['status'], 'failed')
+
+    def test_unexpected_decode_error(self):
+        picture = ProfilePicture.objects.create(user=self.user)
+        picture.queue(BytesIO(b'\x89PNG\r\n\x1a\n broken chunk'))
+        with mock.patch('accounts.models.sanitize_image', side_effect=SyntaxError('broken PNG file')):
+            picture.process()
+        picture.refresh_from_db()
+        self.assertEqual(picture.status, ProfilePicture.FAILED)
+        self.assertEqual(picture.error, 'broken PNG file')
+        self.assertEqual(picture.upload.name, '')
+
+    def test_upload_strips_exif(self):
+        image = Image.new('RGB', (40, 20), 'red')
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotated 90 degrees
+        exif[0x010f] = 'Camera maker'
+        buffer = BytesIO()
+        image.save(buffer, 'JPEG', exif=exif.tobytes())
+        buffer.seek(0)
+        picture = ProfilePicture.objects.create(user=self.user)
+        picture.queue(buffer)
+        picture.process()
+        picture.refresh_from_db()
+        with default_storage.open(picture.image.name) as file:
+            stored = Image.open(file)
+            self.assertEqual(stored.size, (20, 40))
+            self.assertFalse(stored.getexif())
+
+    def test_upload_requires_owner(self):
+        other = User.objects.create_user('other', 'other@example.com')
+        client = APIClient()
+        client.force_authenticate(user=other)
+        url = reverse('tutor-picture', kwargs={'pk': self.tutor.pk})
+        buffer = BytesIO(b'data')
+        buffer.name = 'picture.jpg'
+        response = client.post(url, data={'image': buffer}, format='multipart')
+        self.assertEqual(response.status_code, 403)
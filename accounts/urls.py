@@ -1,7 +1,7 @@
 from django.urls import path, include
 from rest_framework_nested import routers
 
-from meetings.views import MeetingViewSet
+from meetings.views import AvailabilityExceptionViewSet, AvailabilityViewSet, MeetingViewSet
 from messages.views import MessageThreadViewSet
 from .views import StudentViewSet, UserViewSet, TutorViewSet, LocationViewSet, ProfilePictureViewSet, obtain_auth_token
 
@@ -19,6 +19,9 @@ student_location_router.register(r'locations', LocationViewSet, base_name='stude
 
 tutor_location_router = routers.NestedDefaultRouter(router, r'tutors', lookup='tutor')
 tutor_location_router.register(r'locations', LocationViewSet, base_name='tutor-locations')
+tutor_location_router.register(r'availability', AvailabilityViewSet, base_name='tutor-availability')
+tutor_location_router.register(r'availability-exceptions', AvailabilityExceptionViewSet,
+                               base_name='tutor-availability-exceptions')
 
 urlpatterns = router.urls + student_location_router.urls + tutor_location_router.urls
 urlpatterns += [
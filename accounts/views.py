@@ -1,7 +1,10 @@
+from calendar import timegm
+
 from django.db import transaction
-from django.db.models import Avg, Value as V, Prefetch
-from django.db.models.functions import Coalesce
-from django.http import HttpResponse, Http404
+from django.db.models import Prefetch
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.cache import never_cache
 from django.shortcuts import get_object_or_404
@@ -9,40 +12,53 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.decorators import detail_route, api_view, permission_classes, renderer_classes, list_route
 from rest_framework.response import Response
-from rest_framework.renderers import JSONRenderer
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.authtoken.models import Token
 from social_django.utils import psa
 from social_core.actions import do_complete
 
+from findmytutor.replicas import ReplicaReadsMixin, primary
 from messages.models import MessageThread
+from . import profilecache
 from .models import Location, Student, Tutor, User, ProfilePicture
+from .pictures import picture_response
+from .representations import FastJSONRenderer, represent_student, represent_tutor, represent_tutors
 from .permissions import IsOwnerOrReadOnly, IsParentOwnerOrReadOnly, IsStudentOrTutor
 from .serializers import (LocationSerializer, StudentSerializer,
                           TutorSerializer, UserSerializer, ProfilePictureSerializer)
 from .filters import TutorFilterSet
+from .pagination import KeysetPagination, TutorPagination
+
+# Picture URLs are stable per profile, so clients revalidate daily.
+PICTURE_MAX_AGE = 24 * 60 * 60
 
 
-class UserViewSet(ModelViewSet):
+class UserViewSet(ReplicaReadsMixin, ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
+    replica_actions = ('profile',)
 
-    @list_route(["GET"])
+    @list_route(["GET"], renderer_classes=[FastJSONRenderer, BrowsableAPIRenderer])
     @permission_classes([IsAuthenticated])
     def profile(self, request):
         if not request.user.type:
             return Response({}, status=404)
-        tutors = Tutor.objects.annotate(rating=Coalesce(Avg('meetings__review__rating'), V(0.0)))
+        return Response(profilecache.get_or_build(request.user.pk, lambda: self.build_profile(request)))
+
+    def build_profile(self, request):
+        # The payload is cached until the profile changes, so it must not
+        # be built from a replica that may not have that change yet.
+        with primary():
+            return self.serialize_profile(request)
+
+    def serialize_profile(self, request):
         if request.user.type == User.STUDENT:
-            serializer_class = StudentSerializer
-            profile = Student.objects.prefetch_related(Prefetch('tutors', queryset=tutors)).get(user=request.user)
+            data = represent_student(StudentViewSet.queryset.get(user=request.user))
         else:
-            serializer_class = TutorSerializer
-            profile = tutors.get(user=request.user)
-        serializer = serializer_class(profile, context={'request': request})
-        data = serializer.data
+            data = represent_tutor(TutorViewSet.queryset.get(user=request.user))
         data['type'] = request.user.type
-        return Response(data)
+        return data
 
 
 class ProfilePictureViewSet(ModelViewSet):
@@ -77,22 +93,16 @@ class ProfileMixin:
     @permission_classes([IsOwnerOrReadOnly])
     @transaction.atomic()
     def picture(self, request, pk):
-        user = self.get_queryset().get(pk=pk).user
-        obj, created = ProfilePicture.objects.get_or_create(user=user)
         if request.method == 'GET':
-            if not obj.image:
-                raise Http404()
-            response = HttpResponse(obj.image)
-            response['Content-Type'] = 'image/png'
-            return response
-        elif request.method in ['POST', 'PUT']:
-            print(request.body)
-            print(request.data)
-            print(request.parsers)
+            return self.retrieve_picture(request, pk)
+        profile = get_object_or_404(self.queryset.model.objects.select_related('user'), pk=pk)
+        self.check_object_permissions(request, profile)
+        obj, created = ProfilePicture.objects.get_or_create(user=profile.user)
+        if request.method in ['POST', 'PUT']:
             serializer = ProfilePictureSerializer(obj, data=request.data)
             if serializer.is_valid():
                 serializer.save()
-                return Response({'status': 'upload successful'})
+                return Response({'status': 'processing'}, status=202)
             return Response(serializer.errors, status=400)
         else:  # DELETE
             obj.delete()
@@ -100,27 +110,80 @@ class ProfileMixin:
                 raise Http404()
             return Response({'status': 'picture deleted'})
 
+    def retrieve_picture(self, request, pk):
+        lookup = {'user__%s' % self.queryset.model._meta.model_name: pk}
+        obj = ProfilePicture.objects.filter(**lookup).first()
+        if obj is None:
+            raise Http404()
+        if not obj.image:
+            # Nothing to show yet, report how the upload is doing instead.
+            if obj.status == ProfilePicture.PENDING:
+                return Response({'status': 'processing'}, status=202)
+            if obj.status == ProfilePicture.FAILED:
+                return Response({'status': 'failed', 'error': obj.error}, status=404)
+            raise Http404()
+        try:
+            size = int(request.query_params.get('size', ''))
+        except ValueError:
+            size = None
+        name, content_type = obj.variant(size)
+        # Pictures are stored by content hash, so the hash identifies the bytes.
+        etag = quote_etag('%s-%s' % (obj.content_hash, size if name != obj.image.name else 'original'))
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            response = picture_response(name, content_type)
+        response['ETag'] = etag
+        response['X-Picture-Status'] = obj.status
+        patch_cache_control(response, max_age=PICTURE_MAX_AGE)
+        return response
+
     permission_classes = [IsOwnerOrReadOnly]
 
-class StudentViewSet(ProfileMixin, ModelViewSet):
-    queryset = Student.objects.prefetch_related(
-        Prefetch('tutors', queryset=Tutor.objects.annotate(rating=Coalesce(Avg('meetings__review__rating'), V(0.0)))),
+class StudentViewSet(ReplicaReadsMixin, ProfileMixin, ModelViewSet):
+    queryset = Student.objects.select_related('user').prefetch_related(
+        'locations',
+        Prefetch('tutors', queryset=Tutor.objects.select_related('user').prefetch_related('locations', 'tutor_subjects')),
     )
     serializer_class = StudentSerializer
     permission_classes = [IsOwnerOrReadOnly]
+    pagination_class = KeysetPagination
+    replica_actions = ('list', 'retrieve')
 
 
-class TutorViewSet(ProfileMixin, ModelViewSet):
-    queryset = Tutor.objects.annotate(rating=Coalesce(Avg('meetings__review__rating'), V(0.0)))
+class TutorViewSet(ReplicaReadsMixin, ProfileMixin, ModelViewSet):
+    queryset = Tutor.objects.select_related('user').prefetch_related(
+        'locations',
+        'tutor_subjects',
+        Prefetch('students', queryset=Student.objects.select_related('user').prefetch_related('locations')),
+    )
     serializer_class = TutorSerializer
     permission_classes = [IsOwnerOrReadOnly]
+    pagination_class = TutorPagination
+    replica_actions = ('list', 'retrieve', 'search')
+
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            updated_at = Tutor.objects.filter(pk=kwargs['pk']).values_list('updated_at', flat=True).first()
+        except (TypeError, ValueError):
+            raise Http404()
+        if updated_at is None:
+            raise Http404()
+        etag = quote_etag('tutor-%s-%s' % (kwargs['pk'], updated_at.timestamp()))
+        last_modified = timegm(updated_at.utctimetuple())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, max_age=0)
+        return response
 
-    @list_route(['get'])
+    @list_route(['get'], renderer_classes=[FastJSONRenderer, BrowsableAPIRenderer])
     def search(self, request):
-        qs = Tutor.objects.filter(available=True).annotate(rating=Coalesce(Avg('meetings__review__rating'), V(0)))
+        qs = self.get_queryset().filter(available=True)
         f = TutorFilterSet(request.query_params, queryset=qs)
-        serializer = self.get_serializer(f.qs, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(f.qs)
+        return self.get_paginated_response(represent_tutors(page))
 
     @detail_route(['post', 'delete'])
     def my_tutors(self, request, pk):
@@ -0,0 +1,21 @@
+"""
+ASGI config for findmytutor project.
+
+It exposes the ASGI callable as a module-level variable named ``application``,
+serving the WebSocket and long-poll routes in ``findmytutor.routing`` and the
+rest of the site through Django. The Procfile runs it with gunicorn and
+uvicorn workers, see gunicorn.conf.py.
+
+For more information on this file, see
+https://channels.readthedocs.io/en/latest/deploying.html
+"""
+
+import os
+
+import django
+from channels.routing import get_default_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "findmytutor.settings")
+django.setup()
+
+application = get_default_application()
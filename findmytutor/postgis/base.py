@@ -0,0 +1,74 @@
+"""
+PostGIS backend with connection health checks and an optional in-process
+connection pool.
+
+``HEALTH_CHECKS``: before a persistent connection is used for the first time
+in a request, check that it still works and reconnect if it doesn't, so a
+database restart or an idle timeout doesn't fail the next request.
+
+``POOL_SIZE``: when set, connections come from a pool shared by the threads
+of the process and go back to it when Django closes them (at the end of each
+request with ``CONN_MAX_AGE = 0``). The pool must be at least as large as
+the number of threads that use the database at the same time.
+"""
+import threading
+
+from django.contrib.gis.db.backends.postgis.base import DatabaseWrapper as PostGISDatabaseWrapper
+from psycopg2.pool import ThreadedConnectionPool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class DatabaseWrapper(PostGISDatabaseWrapper):
+    health_check_done = False
+
+    def get_pool(self, conn_params):
+        with _pools_lock:
+            pool = _pools.get(self.alias)
+            if pool is None:
+                pool = _pools[self.alias] = ThreadedConnectionPool(1, self.settings_dict['POOL_SIZE'], **conn_params)
+            return pool
+
+    def get_new_connection(self, conn_params):
+        if not self.settings_dict.get('POOL_SIZE'):
+            return super().get_new_connection(conn_params)
+        connection = self.get_pool(conn_params).getconn()
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None or not self.settings_dict.get('POOL_SIZE'):
+            return super()._close()
+        pool = _pools[self.alias]
+        with self.wrap_database_errors:
+            if self.connection.closed:
+                pool.putconn(self.connection, close=True)
+                return
+            # Hand the connection back clean, whatever the request left open.
+            self.connection.rollback()
+            pool.putconn(self.connection)
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Called when a request starts and finishes: check again on next use.
+        self.health_check_done = False
+
+    def ensure_connection(self):
+        if (self.connection is not None and not self.health_check_done
+                and self.settings_dict.get('HEALTH_CHECKS') and not self.in_atomic_block):
+            self.health_check_done = True
+            if not self.is_usable():
+                self.close()
+        super().ensure_connection()
@@ -0,0 +1,96 @@
+"""
+Read replica routing. Read-only viewset actions listed in ``replica_actions``
+read from one of ``DATABASE_REPLICAS``; everything else, and every request of
+a user who wrote something in the last ``REPLICA_STICKY_SECONDS``, uses the
+primary so users always see their own changes.
+"""
+import random
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+_state = threading.local()
+
+
+def replicas_enabled():
+    return getattr(_state, 'enabled', False)
+
+
+def set_replicas_enabled(enabled):
+    _state.enabled = enabled
+
+
+@contextmanager
+def primary():
+    """Read from the primary within the block, e.g. to build something that gets cached."""
+    enabled = replicas_enabled()
+    set_replicas_enabled(False)
+    try:
+        yield
+    finally:
+        set_replicas_enabled(enabled)
+
+
+def sticky_key(user_pk):
+    return f'replica-sticky:{user_pk}'
+
+
+def mark_written(user):
+    cache.set(sticky_key(user.pk), True, settings.REPLICA_STICKY_SECONDS)
+
+
+def is_sticky(user):
+    return user.is_authenticated and cache.get(sticky_key(user.pk)) is not None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if replicas_enabled() and settings.DATABASE_REPLICAS:
+            return random.choice(settings.DATABASE_REPLICAS)
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # Also for instances that were read from a replica.
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        return obj1._state.db in databases and obj2._state.db in databases
+
+    def allow_migrate(self, db, app_label, **hints):
+        # Replicas get their schema from the primary.
+        return db not in settings.DATABASE_REPLICAS
+
+
+class ReplicaReadsMixin:
+    """Serve the viewset actions in ``replica_actions`` from a read replica."""
+    replica_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        set_replicas_enabled(
+            request.method in SAFE_METHODS and self.action in self.replica_actions and not is_sticky(request.user)
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        set_replicas_enabled(False)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class ReplicaStickinessMiddleware:
+    """Send a user's reads to the primary for a while after they changed something."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        # request.user is also set by DRF's token authentication.
+        user = getattr(request, 'user', None)
+        if request.method not in SAFE_METHODS and user is not None and user.is_authenticated:
+            mark_written(user)
+        return response
@@ -0,0 +1,17 @@
+from channels.auth import AuthMiddlewareStack
+from channels.http import AsgiHandler
+from channels.routing import ProtocolTypeRouter, URLRouter
+from django.urls import path, re_path
+
+from messages.consumers import MessagePollConsumer, MessageThreadConsumer
+
+application = ProtocolTypeRouter({
+    # Django's own middleware authenticates the rest of the site.
+    'http': URLRouter([
+        path('api/messages/<int:pk>/poll/', AuthMiddlewareStack(MessagePollConsumer)),
+        re_path(r'', AsgiHandler),
+    ]),
+    'websocket': AuthMiddlewareStack(URLRouter([
+        path('ws/messages/<int:pk>/', MessageThreadConsumer),
+    ])),
+})
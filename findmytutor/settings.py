@@ -49,6 +49,7 @@ INSTALLED_APPS = [
     'rest_framework',
     'rest_framework.authtoken',
     'social_django',
+    'channels',
 
     'accounts.apps.AccountsConfig',
     'meetings.apps.MeetingsConfig',
@@ -64,6 +65,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'accounts.identity.IdentityMapMiddleware',
+    'findmytutor.replicas.ReplicaStickinessMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -88,6 +91,35 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'findmytutor.wsgi.application'
+ASGI_APPLICATION = 'findmytutor.routing.application'
+
+# Live message and meeting events. Messages are created in whichever process
+# served the request, so with more than one process the channel layer must be
+# shared by all of them: set CHANNEL_LAYER_BACKEND to
+# channels_redis.core.RedisChannelLayer to use Redis at $REDIS_URL.
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': env('CHANNEL_LAYER_BACKEND', default='channels.layers.InMemoryChannelLayer'),
+    },
+}
+if CHANNEL_LAYERS['default']['BACKEND'] == 'channels_redis.core.RedisChannelLayer':
+    CHANNEL_LAYERS['default']['CONFIG'] = {
+        'hosts': [env('REDIS_URL', default='redis://localhost:6379/0')],
+    }
+
+# Caches tokens, profiles and search candidates. Invalidation only reaches
+# other worker processes through a shared cache, so set CACHE_URL (e.g.
+# memcache://127.0.0.1:11211) whenever running more than one.
+CACHES = {
+    'default': env.cache('CACHE_URL', default='locmemcache://'),
+}
+# Whether authenticated tokens and profile payloads are cached. Not with a
+# per-process cache and several workers: a deleted token or deactivated user
+# would keep authenticating in the workers that didn't handle the change.
+CACHE_USER_DATA = env.bool('CACHE_USER_DATA', default=(
+    CACHES['default']['BACKEND'] != 'django.core.cache.backends.locmem.LocMemCache'
+    or env.int('WEB_CONCURRENCY', default=1) <= 1
+))
 
 
 # Database
@@ -119,13 +151,18 @@ AUTH_PASSWORD_VALIDATORS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'accounts.authentication.CachedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
     )
 }
 
+# How long authenticated tokens (with their user and profile) stay cached.
+TOKEN_CACHE_TIMEOUT = env.int('TOKEN_CACHE_TIMEOUT', default=5 * 60)
+
 AUTHENTICATION_BACKENDS = [
     'social_core.backends.google.GoogleOAuth2',
+    'accounts.backends.ModelBackend',
+    # Kept so sessions that stored it as their backend still load their user.
     'django.contrib.auth.backends.ModelBackend',
 ]
 
@@ -149,8 +186,35 @@ USE_L10N = True
 USE_TZ = True
 
 # Change 'default' database configuration with $DATABASE_URL.
-DATABASES['default'] =  dj_database_url.config()
-DATABASES['default']['ENGINE'] = 'django.contrib.gis.db.backends.postgis'
+# Connections are kept open for CONN_MAX_AGE seconds and checked before their
+# first use in a request. With threaded workers, DB_POOL_SIZE > 0 shares a
+# pool of that many connections between the threads of a process instead
+# (use it with CONN_MAX_AGE=0, see findmytutor/postgis/base.py).
+DATABASES['default'] = dj_database_url.config(conn_max_age=env.int('CONN_MAX_AGE', default=600))
+DATABASES['default']['ENGINE'] = 'findmytutor.postgis'
+DATABASES['default']['HEALTH_CHECKS'] = env.bool('DB_HEALTH_CHECKS', default=True)
+DATABASES['default']['POOL_SIZE'] = env.int('DB_POOL_SIZE', default=0)
+
+# Read replicas, e.g. DATABASE_REPLICA_URLS=postgis://replica-1/db,postgis://replica-2/db.
+# Read-only actions use them (see findmytutor/replicas.py). In tests they
+# mirror the test database, so pointing DATABASE_REPLICA_URLS at the primary
+# is enough to run the routing tests locally against two connections.
+DATABASE_REPLICAS = []
+for number, url in enumerate(env.list('DATABASE_REPLICA_URLS', default=[]), 1):
+    replica = dj_database_url.parse(url, conn_max_age=DATABASES['default'].get('CONN_MAX_AGE', 0))
+    replica.update({
+        'ENGINE': DATABASES['default']['ENGINE'],
+        'HEALTH_CHECKS': DATABASES['default']['HEALTH_CHECKS'],
+        'POOL_SIZE': DATABASES['default']['POOL_SIZE'],
+        'TEST': {'MIRROR': 'default'},
+    })
+    DATABASES['replica%d' % number] = replica
+    DATABASE_REPLICAS.append('replica%d' % number)
+
+DATABASE_ROUTERS = ['findmytutor.replicas.ReplicaRouter']
+
+# How long a user's reads go to the primary after they wrote something.
+REPLICA_STICKY_SECONDS = env.int('REPLICA_STICKY_SECONDS', default=10)
 
 GDAL_LIBRARY_PATH = os.getenv('GDAL_LIBRARY_PATH')
 GEOS_LIBRARY_PATH = os.getenv('GEOS_LIBRARY_PATH')
@@ -175,3 +239,15 @@ STATICFILES_DIRS = [
 # Simplified static file serving.
 # https://warehouse.python.org/project/whitenoise/
 STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
+
+# Uploaded files (profile pictures)
+MEDIA_ROOT = env('MEDIA_ROOT', default=os.path.join(BASE_DIR, 'media'))
+MEDIA_URL = '/media/'
+
+# Internal location prefix under which the web server serves MEDIA_ROOT, e.g.
+# '/protected-media/'. When set, pictures are sent with X-Accel-Redirect
+# instead of being streamed by Django.
+PICTURE_ACCEL_REDIRECT = env('PICTURE_ACCEL_REDIRECT', default='')
+
+# Threads per worker process for background jobs such as picture processing.
+BACKGROUND_WORKERS = env.int('BACKGROUND_WORKERS', default=2)
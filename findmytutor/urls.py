@@ -18,11 +18,13 @@ from django.contrib import admin
 from django.urls import path, include
 
 from accounts.views import get_token
+from meetings.views import calendar_feed
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('accounts.urls')),
     path('auth/token/', get_token, name='get-token'),
+    path('calendar/<str:token>.ics', calendar_feed, name='calendar-feed'),
     path('auth/', include('social_django.urls', namespace='social')),
     path('auth/', include('rest_framework.urls')),
 ]
@@ -0,0 +1,41 @@
+"""
+Gunicorn settings: ``gunicorn -c gunicorn.conf.py findmytutor.asgi:application``.
+
+The workers are uvicorn workers running the ASGI app, so the WebSocket and
+long-poll routes are served next to the rest of the site. Serving
+``findmytutor.wsgi`` with ``-k gthread`` still works, without those routes.
+
+Requests mostly wait on PostGIS, so each worker process runs Django views on
+several threads (ASGI_THREADS, or ``threads`` for gthread workers). Every
+thread keeps its own persistent database connection (CONN_MAX_AGE), so a
+process holds up to that many connections and the whole dyno ``workers``
+times as many; keep that below the database's connection limit, or set
+DB_POOL_SIZE with CONN_MAX_AGE=0 to cap it per process.
+"""
+import multiprocessing
+import os
+
+bind = '0.0.0.0:%s' % os.environ.get('PORT', '8000')
+
+# WEB_CONCURRENCY is set by Heroku according to the dyno size. The workers
+# inherit it, and settings.py only caches user data in a per-process cache
+# with a single worker.
+workers = int(os.environ.setdefault('WEB_CONCURRENCY', str(multiprocessing.cpu_count() * 2 + 1)))
+worker_class = 'uvicorn.workers.UvicornWorker'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+# asgiref runs Django's synchronous code on a thread pool of this size.
+os.environ.setdefault('ASGI_THREADS', str(threads))
+
+# Each worker starts its own background job threads and database listener, so
+# the application is loaded after forking.
+preload_app = False
+
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then to contain memory growth (Pillow, GEOS).
+max_requests = 1000
+max_requests_jitter = 100
+
+accesslog = '-'
@@ -1,5 +1,5 @@
 from django.contrib import admin
 
-from .models import Meeting, Review
+from .models import Availability, AvailabilityException, CalendarFeed, Meeting, Review
 
-admin.site.register([Meeting, Review])
+admin.site.register([Meeting, Review, Availability, AvailabilityException, CalendarFeed])
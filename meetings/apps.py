@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class MeetingsConfig(AppConfig):
     name = 'meetings'
+
+    def ready(self):
+        from . import signals  # noqa: F401
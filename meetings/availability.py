@@ -0,0 +1,79 @@
+"""
+Free slot computation. Intervals are (start, end) pairs of aware datetimes;
+they are kept sorted and merged, so availability and bookings are combined
+with linear sweeps.
+"""
+import datetime
+from itertools import islice
+
+from django.utils import timezone
+
+from .models import Meeting
+
+MAX_RANGE = datetime.timedelta(days=62)
+
+
+def merge(intervals):
+    """Sort intervals and merge the ones that overlap or touch."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def subtract(intervals, removed):
+    """Parts of the merged ``intervals`` not covered by the merged ``removed`` intervals."""
+    result = []
+    first = 0
+    for start, end in intervals:
+        while first < len(removed) and removed[first][1] <= start:
+            first += 1
+        # A removed interval can span several intervals, so don't consume it here.
+        for removed_start, removed_end in islice(removed, first, None):
+            if removed_start >= end:
+                break
+            if removed_start > start:
+                result.append((start, removed_start))
+            start = max(start, removed_end)
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def weekly_intervals(windows, start, end):
+    """Occurrences of the weekly ``windows`` between ``start`` and ``end``."""
+    tz = timezone.get_current_timezone()
+    by_weekday = {}
+    for window in windows:
+        by_weekday.setdefault(window.weekday, []).append(window)
+    day = timezone.localtime(start, tz).date()
+    last = timezone.localtime(end, tz).date()
+    intervals = []
+    while day <= last:
+        for window in by_weekday.get(day.weekday(), []):
+            intervals.append((
+                timezone.make_aware(datetime.datetime.combine(day, window.start_time), tz),
+                timezone.make_aware(datetime.datetime.combine(day, window.end_time), tz),
+            ))
+        day += datetime.timedelta(days=1)
+    return intervals
+
+
+def clip(intervals, start, end):
+    return [(max(s, start), min(e, end)) for s, e in intervals if s < end and e > start]
+
+
+def free_slots(tutor, start, end):
+    """Merged intervals between ``start`` and ``end`` in which ``tutor`` can be booked."""
+    exceptions = list(tutor.availability_exceptions.filter(end__gt=start, start__lt=end))
+    open_intervals = weekly_intervals(tutor.availabilities.all(), start, end)
+    open_intervals += [(e.start, e.end) for e in exceptions if e.available]
+    busy = [(e.start, e.end) for e in exceptions if not e.available]
+    busy += tutor.meetings.filter(
+        end__gt=start, start__lt=end,
+    ).exclude(state=Meeting.CANCELLED).values_list('start', 'end')
+    return clip(subtract(merge(open_intervals), merge(busy)), start, end)
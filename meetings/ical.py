@@ -0,0 +1,69 @@
+"""Streaming iCalendar (RFC 5545) rendering of meetings."""
+from django.utils import timezone
+
+from accounts.models import User
+from .models import Meeting
+
+PRODID = '-//findmytutor//meetings//EN'
+STATUSES = {
+    Meeting.ACCEPTED: 'CONFIRMED',
+    Meeting.CANCELLED: 'CANCELLED',
+    Meeting.PENDING_STUDENT: 'TENTATIVE',
+    Meeting.PENDING_TUTOR: 'TENTATIVE',
+}
+
+
+def escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def fold(line):
+    """Split a content line into lines of at most 75 octets."""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts, start, limit = [], 0, 75
+    while start < len(encoded):
+        end = min(start + limit, len(encoded))
+        # Don't split a multi-byte character.
+        while end < len(encoded) and (encoded[end] & 0xC0) == 0x80:
+            end -= 1
+        parts.append(encoded[start:end].decode('utf-8'))
+        start, limit = end, 74
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def format_datetime(value):
+    return timezone.localtime(value, timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def render_meeting(meeting, side, host):
+    other = meeting.tutor if side == User.STUDENT else meeting.student
+    name = other.user.get_full_name() or other.user.username
+    lines = [
+        'BEGIN:VEVENT',
+        'UID:meeting-%s@%s' % (meeting.pk, host),
+        'DTSTAMP:%s' % format_datetime(meeting.updated_at),
+        'LAST-MODIFIED:%s' % format_datetime(meeting.updated_at),
+        'DTSTART:%s' % format_datetime(meeting.start),
+        'DTEND:%s' % format_datetime(meeting.end),
+        'SUMMARY:%s' % escape('Meeting with %s' % name),
+        'STATUS:%s' % STATUSES[meeting.state],
+    ]
+    if meeting.location is not None:
+        lines.append('LOCATION:%s' % escape(meeting.location.address))
+        lines.append('GEO:%s;%s' % (meeting.location.latitude, meeting.location.longitude))
+    lines.append('END:VEVENT')
+    return ''.join(fold(line) for line in lines)
+
+
+def render_calendar(meetings, side, host):
+    """Yield the calendar piece by piece; ``meetings`` is iterated lazily."""
+    yield ''.join(fold(line) for line in [
+        'BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:%s' % PRODID, 'CALSCALE:GREGORIAN',
+        'X-WR-CALNAME:%s' % escape('findmytutor meetings'),
+    ])
+    for meeting in meetings:
+        yield render_meeting(meeting, side, host)
+    yield fold('END:VCALENDAR')
@@ -0,0 +1,42 @@
+# Generated by Django 2.0 on 2026-10-18 16:40
+
+from django.db import migrations, models
+
+
+def set_states(apps, schema_editor):
+    Meeting = apps.get_model('meetings', 'Meeting')
+    Meeting.objects.filter(
+        models.Q(tutor_cancelled_at__isnull=False) | models.Q(student_cancelled_at__isnull=False),
+    ).update(state='cancelled')
+    meetings = Meeting.objects.filter(tutor_cancelled_at=None, student_cancelled_at=None)
+    meetings.filter(student_accepted_at=None).update(state='pending-student')
+    meetings.filter(student_accepted_at__isnull=False, tutor_accepted_at=None).update(state='pending-tutor')
+    meetings.filter(student_accepted_at__isnull=False, tutor_accepted_at__isnull=False).update(state='accepted')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('meetings', '0002_auto_20180326_1235'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='meeting',
+            options={},
+        ),
+        migrations.AddField(
+            model_name='meeting',
+            name='state',
+            field=models.CharField(choices=[('pending-student', 'Waiting for the student'), ('pending-tutor', 'Waiting for the tutor'), ('accepted', 'Accepted'), ('cancelled', 'Cancelled')], default='pending-tutor', max_length=20),
+        ),
+        migrations.RunPython(set_states, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['tutor', 'state', 'start', 'id'], name='meeting_tutor_state_start'),
+        ),
+        migrations.AddIndex(
+            model_name='meeting',
+            index=models.Index(fields=['student', 'state', 'start', 'id'], name='meeting_student_state_start'),
+        ),
+    ]
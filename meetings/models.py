@@ -1,9 +1,75 @@
+import secrets
+
 from django.db import models
+from django.db.models import Case, Value, When
+from django.utils import timezone
 
 from accounts.models import User
 
 
+def new_feed_token():
+    return secrets.token_urlsafe(32)
+
+
+class MeetingQuerySet(models.QuerySet):
+    """
+    Accept, cancel and reopen many meetings with one UPDATE each. They only
+    touch the eligible rows and keep ``state`` in sync in SQL.
+    """
+
+    def eligible(self, action, side):
+        if action == 'accept':
+            return self.filter(**{'%s_accepted_at' % side: None}).exclude(state=Meeting.CANCELLED)
+        if action == 'cancel':
+            return self.filter(**{'%s_cancelled_at' % side: None})
+        return self.exclude(**{'%s_cancelled_at' % side: None})
+
+    def accept(self, side):
+        other = Meeting.other_side(side)
+        now = timezone.now()
+        return self.eligible('accept', side).update(**{
+            '%s_accepted_at' % side: now,
+            'state': Case(
+                When(**{'%s_accepted_at__isnull' % other: False, 'then': Value(Meeting.ACCEPTED)}),
+                default=Value(Meeting.pending(other)),
+            ),
+            'updated_at': now,
+        })
+
+    def cancel(self, side):
+        now = timezone.now()
+        return self.eligible('cancel', side).update(**{
+            '%s_cancelled_at' % side: now,
+            'state': Meeting.CANCELLED,
+            'updated_at': now,
+        })
+
+    def reopen(self, side):
+        other = Meeting.other_side(side)
+        return self.eligible('reopen', side).update(**{
+            '%s_cancelled_at' % side: None,
+            'state': Case(
+                When(**{'%s_cancelled_at__isnull' % other: False, 'then': Value(Meeting.CANCELLED)}),
+                When(student_accepted_at=None, then=Value(Meeting.PENDING_STUDENT)),
+                When(tutor_accepted_at=None, then=Value(Meeting.PENDING_TUTOR)),
+                default=Value(Meeting.ACCEPTED),
+            ),
+            'updated_at': timezone.now(),
+        })
+
+
 class Meeting(models.Model):
+    PENDING_STUDENT = 'pending-student'
+    PENDING_TUTOR = 'pending-tutor'
+    ACCEPTED = 'accepted'
+    CANCELLED = 'cancelled'
+    STATES = (
+        (PENDING_STUDENT, 'Waiting for the student'),
+        (PENDING_TUTOR, 'Waiting for the tutor'),
+        (ACCEPTED, 'Accepted'),
+        (CANCELLED, 'Cancelled'),
+    )
+
     tutor = models.ForeignKey('accounts.Tutor', on_delete=models.CASCADE, related_name='meetings')
     tutor_accepted_at = models.DateTimeField(null=True, blank=True)
     tutor_cancelled_at = models.DateTimeField(null=True, blank=True)
@@ -15,6 +81,35 @@ class Meeting(models.Model):
     start = models.DateTimeField()
     end = models.DateTimeField()
     location = models.ForeignKey('accounts.Location', on_delete=models.SET_NULL, null=True, related_name='meetings')
+    # Derived from the accepted/cancelled timestamps on save.
+    state = models.CharField(max_length=20, choices=STATES, default=PENDING_TUTOR)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = MeetingQuerySet.as_manager()
+
+    @staticmethod
+    def other_side(side):
+        return User.TUTOR if side == User.STUDENT else User.STUDENT
+
+    @staticmethod
+    def pending(side):
+        """State of meetings waiting for ``side`` to accept."""
+        return Meeting.PENDING_STUDENT if side == User.STUDENT else Meeting.PENDING_TUTOR
+
+    def get_state(self):
+        if self.is_cancelled:
+            return self.CANCELLED
+        if self.student_accepted_at is None:
+            return self.PENDING_STUDENT
+        if self.tutor_accepted_at is None:
+            return self.PENDING_TUTOR
+        return self.ACCEPTED
+
+    def save(self, *args, **kwargs):
+        self.state = self.get_state()
+        if kwargs.get('update_fields') is not None:
+            kwargs['update_fields'] = set(kwargs['update_fields']) | {'state', 'updated_at'}
+        super().save(*args, **kwargs)
 
     @property
     def is_accepted(self):
@@ -33,7 +128,48 @@ class Meeting(models.Model):
         return User.STUDENT if self.student_accepted_at < self.tutor_accepted_at else User.TUTOR
 
     class Meta:
-        ordering = ['start']
+        indexes = [
+            models.Index(fields=['tutor', 'state', 'start', 'id'], name='meeting_tutor_state_start'),
+            models.Index(fields=['student', 'state', 'start', 'id'], name='meeting_student_state_start'),
+            # Overlap checks: meetings that haven't ended yet.
+            models.Index(fields=['tutor', 'end'], name='meeting_tutor_end'),
+            models.Index(fields=['student', 'end'], name='meeting_student_end'),
+        ]
+
+
+class Availability(models.Model):
+    """A weekly recurring window in which a tutor can be booked, in the server's time zone."""
+    WEEKDAYS = tuple(enumerate(['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']))
+    tutor = models.ForeignKey('accounts.Tutor', on_delete=models.CASCADE, related_name='availabilities')
+    weekday = models.IntegerField(choices=WEEKDAYS)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+
+    class Meta:
+        ordering = ['weekday', 'start_time']
+
+
+class AvailabilityException(models.Model):
+    """A one-off period in which a tutor is unavailable, or available outside the weekly windows."""
+    tutor = models.ForeignKey('accounts.Tutor', on_delete=models.CASCADE, related_name='availability_exceptions')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    available = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['tutor', 'end'], name='availabilityexception_end'),
+        ]
+
+
+class CalendarFeed(models.Model):
+    """Secret token of a user's iCalendar feed, so calendar apps can subscribe without logging in."""
+    user = models.OneToOneField('accounts.User', on_delete=models.CASCADE, related_name='calendar_feed')
+    token = models.CharField(max_length=64, unique=True, default=new_feed_token)
+
+    def rotate(self):
+        self.token = new_feed_token()
+        self.save(update_fields=['token'])
 
 
 class Review(models.Model):
@@ -0,0 +1,15 @@
+from accounts.pagination import KeysetPagination
+
+
+class MeetingPagination(KeysetPagination):
+    """Keyset pages of meetings in the order of the queryset, by start time by default."""
+    ordering = ['start', 'pk']
+
+    def get_ordering(self, queryset):
+        return list(queryset.query.order_by) or self.ordering
+
+    def get_key_value(self, obj, field):
+        value = super().get_key_value(obj, field)
+        if field == 'start':
+            return value.isoformat()
+        return value
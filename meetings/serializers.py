@@ -5,7 +5,7 @@ from rest_framework import serializers
 
 from accounts.serializers import LocationSerializer
 from accounts.models import Location
-from .models import Meeting, Review
+from .models import Availability, AvailabilityException, Meeting, Review
 
 
 class ReviewSerializer(serializers.ModelSerializer):
@@ -40,3 +40,25 @@ class MeetingSerializer(serializers.ModelSerializer):
         location = validated_data.pop('location')
         LocationSerializer(instance.location, data=location).save()
         return super().update(instance, validated_data)
+
+
+class AvailabilitySerializer(serializers.ModelSerializer):
+    def validate(self, attrs):
+        if attrs['start_time'] >= attrs['end_time']:
+            raise serializers.ValidationError('Start time must be before end time')
+        return attrs
+
+    class Meta:
+        model = Availability
+        fields = ['pk', 'weekday', 'start_time', 'end_time']
+
+
+class AvailabilityExceptionSerializer(serializers.ModelSerializer):
+    def validate(self, attrs):
+        if attrs['start'] >= attrs['end']:
+            raise serializers.ValidationError('Start date must be before end date')
+        return attrs
+
+    class Meta:
+        model = AvailabilityException
+        fields = ['pk', 'start', 'end', 'available']
@@ -0,0 +1,30 @@
+from django.db.models import Q
+from django.db.models.signals import post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from accounts.models import Location, User
+
+from .models import Meeting
+
+# User fields that the calendar feed shows for the other side of a meeting.
+NAME_FIELDS = {'username', 'first_name', 'last_name'}
+
+
+def touch_meetings(*args, **kwargs):
+    """Mark meetings as changed, e.g. for the ETag and LAST-MODIFIED of calendar feeds."""
+    Meeting.objects.filter(*args, **kwargs).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is not None and not NAME_FIELDS & set(update_fields):
+        return
+    touch_meetings(Q(tutor__user=instance) | Q(student__user=instance))
+
+
+@receiver(post_save, sender=Location)
+@receiver(pre_delete, sender=Location)
+def location_changed(sender, instance, **kwargs):
+    # Deleting the location sets it to NULL without touching the meetings.
+    touch_meetings(location=instance)
@@ -1,5 +1,7 @@
 import datetime
+from io import StringIO
 
+from django.core.management import call_command
 from django.urls import reverse
 from django.utils import timezone
 from rest_framework.test import APITestCase, APIClient
@@ -116,6 +118,223 @@ class MeetingsTestCase(APITestCase):
         meeting.refresh_from_db()
         self.assertFalse(meeting.is_cancelled)
 
+    def test_meeting_lists(self):
+        student = self.student.profile
+        tutor = self.tutor.profile
+        now = timezone.now()
+        requested = [
+            Meeting.objects.create(
+                student=student, tutor=tutor, student_accepted_at=now,
+                start=now + datetime.timedelta(days=2, hours=i), end=now + datetime.timedelta(days=2, hours=i + 1),
+            )
+            for i in range(3)
+        ]
+        self.assertEqual(requested[0].state, Meeting.PENDING_TUTOR)
+        client = APIClient()
+        client.force_authenticate(user=self.tutor)
+
+        data = client.get(reverse('meeting-list'), data={'requests': '', 'page_size': 2}).json()
+        self.assertEqual([m['pk'] for m in data['results']], [m.pk for m in requested[:2]])
+        data = client.get(data['next']).json()
+        self.assertEqual([m['pk'] for m in data['results']], [requested[2].pk])
+        self.assertIsNone(data['next'])
+
+        client.post(reverse('meeting-accept', kwargs={'pk': requested[0].pk}))
+        client.post(reverse('meeting-cancel', kwargs={'pk': requested[1].pk}))
+        requested[0].refresh_from_db()
+        self.assertEqual(requested[0].state, Meeting.ACCEPTED)
+        data = client.get(reverse('meeting-list'), data={'requests': ''}).json()
+        self.assertEqual([m['pk'] for m in data['results']], [requested[2].pk])
+        data = client.get(reverse('meeting-list'), data={'future': ''}).json()
+        self.assertEqual([m['pk'] for m in data['results']], [requested[0].pk])
+
+        client.delete(reverse('meeting-cancel', kwargs={'pk': requested[1].pk}))
+        self.assertEqual(Meeting.objects.get(pk=requested[1].pk).state, Meeting.PENDING_TUTOR)
+        data = client.get(reverse('meeting-list'), data={'past': ''}).json()
+        self.assertEqual([m['pk'] for m in data['results']], [self.past_meeting.pk])
+
+    def test_reject_overlapping_meeting(self):
+        student = self.student.profile
+        tutor = self.tutor.profile
+        student.tutors.add(tutor)
+        data = {
+            'tutor': tutor.id,
+            'student': student.id,
+            'start': '2021-03-05 12:00:00',
+            'end': '2021-03-05 13:00:00',
+            'location': student.locations.first().pk,
+        }
+        client = APIClient()
+        client.force_authenticate(user=self.student)
+        response = client.post(reverse('meeting-list'), data=data, format='json')
+        self.assertEqual(response.status_code, 201)
+        response = client.post(reverse('meeting-list'), data=dict(data, start='2021-03-05 12:30:00',
+                                                                  end='2021-03-05 13:30:00'), format='json')
+        self.assertEqual(response.status_code, 400)
+        response = client.post(reverse('meeting-list'), data=dict(data, start='2021-03-05 13:00:00',
+                                                                  end='2021-03-05 14:00:00'), format='json')
+        self.assertEqual(response.status_code, 201)
+
+        Meeting.objects.filter(start=timezone.make_aware(datetime.datetime(2021, 3, 5, 12))).update(
+            student_cancelled_at=timezone.now(), state=Meeting.CANCELLED,
+        )
+        response = client.post(reverse('meeting-list'), data=dict(data, start='2021-03-05 11:30:00',
+                                                                  end='2021-03-05 12:30:00'), format='json')
+        self.assertEqual(response.status_code, 201)
+
+        # Reopening the cancelled meeting would double-book the slot.
+        cancelled = Meeting.objects.get(start=timezone.make_aware(datetime.datetime(2021, 3, 5, 12)))
+        response = client.delete(reverse('meeting-cancel', kwargs={'pk': cancelled.pk}))
+        self.assertEqual(response.status_code, 400)
+        cancelled.refresh_from_db()
+        self.assertEqual(cancelled.state, Meeting.CANCELLED)
+
+    def test_reject_update_overlapping_new_tutor(self):
+        student = self.student.profile
+        other_tutor = Tutor.objects.create(
+            user=User.objects.create_user('other', type=User.TUTOR), date_of_birth=datetime.date(1999, 12, 31),
+        )
+        other_student = Student.objects.create(
+            user=User.objects.create_user('other-student', type=User.STUDENT),
+            date_of_birth=datetime.date(1999, 12, 31),
+        )
+        start, end = self.future_meeting.start, self.future_meeting.end
+        Meeting.objects.create(student=other_student, tutor=other_tutor, start=start, end=end)
+
+        client = APIClient()
+        client.force_authenticate(user=self.student)
+        response = client.put(reverse('meeting-detail', kwargs={'pk': self.future_meeting.pk}), data={
+            'tutor': other_tutor.pk,
+            'student': student.pk,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'location': {'address': 'Stationsplein 1', 'google_id': 'station', 'latitude': 42.0, 'longitude': 37.0},
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Meeting.objects.get(pk=self.future_meeting.pk).tutor_id, self.tutor.profile.pk)
+
+    def test_free_slots(self):
+        tutor = self.tutor.profile
+        # 2021-03-01 is a Monday.
+        tutor.availabilities.create(weekday=0, start_time=datetime.time(9), end_time=datetime.time(17))
+        tutor.availability_exceptions.create(
+            start=timezone.make_aware(datetime.datetime(2021, 3, 1, 12)),
+            end=timezone.make_aware(datetime.datetime(2021, 3, 1, 13)),
+        )
+        tutor.availability_exceptions.create(
+            start=timezone.make_aware(datetime.datetime(2021, 3, 2, 10)),
+            end=timezone.make_aware(datetime.datetime(2021, 3, 2, 11)),
+            available=True,
+        )
+        Meeting.objects.create(
+            student=self.student.profile, tutor=tutor,
+            start=timezone.make_aware(datetime.datetime(2021, 3, 1, 15)),
+            end=timezone.make_aware(datetime.datetime(2021, 3, 1, 16)),
+        )
+        client = APIClient()
+        client.force_authenticate(user=self.student)
+        url = reverse('tutor-availability-free', kwargs={'tutor_pk': tutor.pk})
+        response = client.get(url, data={'start': '2021-03-01', 'end': '2021-03-08'})
+        self.assertEqual(response.status_code, 200)
+        slots = [(slot['start'][:16], slot['end'][:16]) for slot in response.json()['results']]
+        self.assertEqual(slots, [
+            ('2021-03-01T09:00', '2021-03-01T12:00'),
+            ('2021-03-01T13:00', '2021-03-01T15:00'),
+            ('2021-03-01T16:00', '2021-03-01T17:00'),
+            ('2021-03-02T10:00', '2021-03-02T11:00'),
+        ])
+        response = client.get(url, data={'start': '2021-03-01', 'end': '2021-12-01'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_calendar_feed(self):
+        client = APIClient()
+        client.force_authenticate(user=self.student)
+        url = client.get(reverse('meeting-feed')).json()['url']
+        self.assertEqual(client.get(reverse('meeting-feed')).json()['url'], url)
+
+        feed = APIClient()
+        response = feed.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/calendar; charset=utf-8')
+        calendar = b''.join(response.streaming_content).decode()
+        self.assertTrue(calendar.startswith('BEGIN:VCALENDAR\r\n'))
+        self.assertEqual(calendar.count('BEGIN:VEVENT'), 2)
+        self.assertIn('UID:meeting-%s@' % self.future_meeting.pk, calendar)
+        self.assertIn('SUMMARY:Meeting with tutor', calendar)
+
+        etag = response['ETag']
+        self.assertEqual(feed.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        client.force_authenticate(user=self.tutor)
+        client.post(reverse('meeting-accept', kwargs={'pk': self.future_meeting.pk}))
+        response = feed.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+        # The feed shows the tutor's name, which is not part of the meetings.
+        etag = response['ETag']
+        self.tutor.first_name = 'Ada'
+        self.tutor.save()
+        response = feed.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('SUMMARY:Meeting with Ada', b''.join(response.streaming_content).decode())
+
+        client.force_authenticate(user=self.student)
+        new_url = client.post(reverse('meeting-feed')).json()['url']
+        self.assertNotEqual(new_url, url)
+        self.assertEqual(feed.get(url).status_code, 404)
+
+    def test_bulk_actions(self):
+        student = self.student.profile
+        tutor = self.tutor.profile
+        now = timezone.now()
+        meetings = [
+            Meeting.objects.create(
+                student=student, tutor=tutor, student_accepted_at=now,
+                start=now + datetime.timedelta(days=3, hours=i), end=now + datetime.timedelta(days=3, hours=i + 1),
+            )
+            for i in range(3)
+        ]
+        other_tutor = Tutor.objects.create(
+            user=User.objects.create_user('other', type=User.TUTOR), date_of_birth=datetime.date(1999, 12, 31),
+        )
+        foreign = Meeting.objects.create(student=student, tutor=other_tutor, start=now, end=now)
+        meetings[2].tutor_cancelled_at = now
+        meetings[2].save()
+
+        client = APIClient()
+        client.force_authenticate(user=self.tutor)
+        ids = [m.pk for m in meetings] + [foreign.pk]
+        # JSON booleans are ints in Python, but not meeting ids.
+        response = client.post(reverse('meeting-bulk-accept'), data={'meetings': [True]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = client.post(reverse('meeting-bulk-accept'), data={'meetings': ids}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r['status'] for r in response.json()['results']],
+                         ['accepted', 'accepted', 'unchanged', 'not found'])
+        self.assertEqual([m.state for m in Meeting.objects.filter(pk__in=ids).order_by('pk')],
+                         [Meeting.ACCEPTED, Meeting.ACCEPTED, Meeting.CANCELLED, Meeting.PENDING_STUDENT])
+
+        response = client.post(reverse('meeting-bulk-cancel'), data={'meetings': ids[:2]}, format='json')
+        self.assertEqual([r['status'] for r in response.json()['results']], ['cancelled', 'cancelled'])
+        response = client.post(reverse('meeting-bulk-reopen'), data={'meetings': ids[:3]}, format='json')
+        self.assertEqual([r['status'] for r in response.json()['results']], ['reopened'] * 3)
+        self.assertEqual([m.state for m in Meeting.objects.filter(pk__in=ids[:3]).order_by('pk')],
+                         [Meeting.ACCEPTED, Meeting.ACCEPTED, Meeting.PENDING_TUTOR])
+
+        # The slot of a cancelled meeting is booked again before it is reopened.
+        client.post(reverse('meeting-bulk-cancel'), data={'meetings': ids[:2]}, format='json')
+        Meeting.objects.create(
+            student=student, tutor=tutor, student_accepted_at=now, start=meetings[0].start, end=meetings[0].end,
+        )
+        response = client.post(reverse('meeting-bulk-reopen'), data={'meetings': ids[:2]}, format='json')
+        self.assertEqual([r['status'] for r in response.json()['results']],
+                         ['overlaps another meeting', 'reopened'])
+        self.assertEqual([m.state for m in Meeting.objects.filter(pk__in=ids[:2]).order_by('pk')],
+                         [Meeting.CANCELLED, Meeting.ACCEPTED])
+
+        response = client.post(reverse('meeting-bulk-accept'), data={'meetings': 'all'}, format='json')
+        self.assertEqual(response.status_code, 400)
+
     def test_review(self):
         data = {
             'rating': '3',
@@ -132,3 +351,31 @@ class MeetingsTestCase(APITestCase):
         review = meeting.review
         self.assertEqual(review.rating, 3)
         self.assertEqual(review.review, 'This was a great session!')
+
+    def test_review_updates_tutor_rating(self):
+        client = APIClient()
+        client.force_authenticate(user=self.student)
+        url = reverse('meeting-review', kwargs={'pk': self.past_meeting.pk})
+        tutor = self.tutor.tutor
+
+        response = client.post(url, data={'rating': '4'}, format='json')
+        self.assertEqual(response.status_code, 201)
+        tutor.refresh_from_db()
+        self.assertEqual((tutor.rating_sum, tutor.rating_count, tutor.rating), (4, 1, 4.0))
+
+        response = client.put(url, data={'rating': '2'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        tutor.refresh_from_db()
+        self.assertEqual((tutor.rating_sum, tutor.rating_count, tutor.rating), (2, 1, 2.0))
+
+        response = client.delete(url)
+        self.assertEqual(response.status_code, 200)
+        tutor.refresh_from_db()
+        self.assertEqual((tutor.rating_sum, tutor.rating_count, tutor.rating), (0, 0, 0.0))
+
+    def test_rebuild_ratings(self):
+        Review.objects.create(meeting=self.past_meeting, rating=5)
+        Review.objects.create(meeting=self.future_meeting, rating=2)
+        call_command('rebuild_ratings', stdout=StringIO())
+        tutor = Tutor.objects.get(user=self.tutor)
+        self.assertEqual((tutor.rating_sum, tutor.rating_count, tutor.rating), (7, 2, 3.5))
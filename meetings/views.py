@@ -1,42 +1,72 @@
+import datetime
+
 from django.utils import timezone
 from django.db import transaction
-from django.db.models import Q
+from django.db.models import Count, Max, Q
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import quote_etag
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import detail_route
+from rest_framework import serializers
+from rest_framework.decorators import detail_route, list_route
 from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 
-from accounts.models import User
-from accounts.permissions import IsStudent
+from accounts.models import Student, Tutor, User
+from accounts.permissions import IsParentOwnerOrReadOnly, IsStudent
+from findmytutor.replicas import ReplicaReadsMixin
+from messages.events import publish_meeting, publish_meetings
+
+from .availability import MAX_RANGE, free_slots
+from .ical import render_calendar
+from .models import CalendarFeed, Meeting, Review
+from .pagination import MeetingPagination
+from .serializers import (AvailabilityExceptionSerializer, AvailabilitySerializer, MeetingSerializer,
+                          ReviewSerializer)
 
-from .models import Meeting, Review
-from .serializers import MeetingSerializer, ReviewSerializer
+MAX_BULK_MEETINGS = 500
 
 
-class MeetingViewSet(ModelViewSet):
+class MeetingViewSet(ReplicaReadsMixin, ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = MeetingSerializer
+    pagination_class = MeetingPagination
+    replica_actions = ('list',)
 
     def get_queryset(self):
+        side = self.request.user.type
         qs = self.request.user.profile.meetings.all()
         if 'past' in self.request.query_params:
-            qs = qs.filter(end__lt=timezone.now()).reverse()
+            qs = qs.filter(end__lt=timezone.now()).order_by('-start', '-pk')
         elif 'future' in self.request.query_params:
-            qs = qs.filter(end__gte=timezone.now())
-            qs = qs.exclude(**{
-                '%s_accepted_at' % self.request.user.type: None,
-                '%s_cancelled_at' % self.request.user.type: None,
-            })
-            qs = qs.filter(tutor_cancelled_at=None, student_cancelled_at=None)
+            # Accepted by this side and not cancelled.
+            qs = qs.filter(end__gte=timezone.now(), state__in=[
+                Meeting.ACCEPTED, Meeting.pending(User.TUTOR if side == User.STUDENT else User.STUDENT),
+            ]).exclude(**{'%s_accepted_at' % side: None})
         elif 'requests' in self.request.query_params:
-            qs = qs.filter(end__gte=timezone.now())
-            qs = qs.filter(**{
-                '%s_accepted_at' % self.request.user.type: None,
-                '%s_cancelled_at' % self.request.user.type: None,
-            })
+            qs = qs.filter(end__gte=timezone.now(), state=Meeting.pending(side))
         return qs
 
+    def check_overlap(self, tutor, student, start, end, instance=None):
+        """
+        Reject a meeting that overlaps another meeting of the tutor or the
+        student. Both profiles are locked first, so concurrent bookings are
+        checked one after the other.
+        """
+        Tutor.objects.select_for_update().filter(pk=tutor.pk).exists()
+        Student.objects.select_for_update().filter(pk=student.pk).exists()
+        overlapping = Meeting.objects.filter(
+            Q(tutor=tutor) | Q(student=student), start__lt=end, end__gt=start,
+        ).exclude(state=Meeting.CANCELLED)
+        if instance is not None:
+            overlapping = overlapping.exclude(pk=instance.pk)
+        if overlapping.exists():
+            raise ValidationError('meeting overlaps another meeting')
+
     @transaction.atomic()
     def perform_create(self, serializer):
         data = {}
@@ -44,55 +74,262 @@ class MeetingViewSet(ModelViewSet):
             self.request.user.student.tutors.add(serializer.validated_data['tutor'])
             data['student'] = self.request.user.student
             data['student_accepted_at'] = timezone.now()
+            tutor, student = serializer.validated_data['tutor'], data['student']
         else:
             self.request.user.tutor.students.add(serializer.validated_data['student'])
             data['tutor'] = self.request.user.tutor
             data['tutor_accepted_at'] = timezone.now()
+            tutor, student = data['tutor'], serializer.validated_data['student']
+        self.check_overlap(tutor, student, serializer.validated_data['start'], serializer.validated_data['end'])
         serializer.save(**data)
 
+    @transaction.atomic()
+    def perform_update(self, serializer):
+        instance = serializer.instance
+        # The update may move the meeting to another tutor or student.
+        self.check_overlap(
+            serializer.validated_data.get('tutor', instance.tutor),
+            serializer.validated_data.get('student', instance.student),
+            serializer.validated_data.get('start', instance.start),
+            serializer.validated_data.get('end', instance.end),
+            instance=instance,
+        )
+        serializer.save()
+
     def perform_destroy(self, instance):
-        if self.request.user.type == User.STUDENT:
-            instance.student_cancelled_at = timezone.now()
-        else:
-            instance.tutor_cancelled_at = timezone.now()
-        instance.save()
+        field = '%s_cancelled_at' % self.request.user.type
+        setattr(instance, field, timezone.now())
+        instance.save(update_fields=[field])
+        publish_meeting(instance, 'cancelled', self.request.user.type)
 
     @detail_route(['post'])
     def accept(self, request, pk):
         obj = self.get_object()
-        if self.request.user.type == User.STUDENT:
-            obj.student_accepted_at = timezone.now()
-        if self.request.user.type == User.TUTOR:
-            obj.tutor_accepted_at = timezone.now()
-        obj.save()
+        field = '%s_accepted_at' % request.user.type
+        setattr(obj, field, timezone.now())
+        obj.save(update_fields=[field])
+        publish_meeting(obj, 'accepted', request.user.type)
         return Response({'status': 'meeting accepted'})
 
     @detail_route(['post', 'delete'])
+    @transaction.atomic()
     def cancel(self, request, pk):
         obj = self.get_object()
-        if self.request.user.type == User.STUDENT:
-            obj.student_cancelled_at = timezone.now() if request.method == 'POST' else None
-        if self.request.user.type == User.TUTOR:
-            obj.tutor_cancelled_at = timezone.now() if request.method == 'POST' else None
-        obj.save()
+        field = '%s_cancelled_at' % request.user.type
+        setattr(obj, field, timezone.now() if request.method == 'POST' else None)
+        if request.method == 'DELETE' and obj.get_state() != Meeting.CANCELLED:
+            # Reopening takes the slot again, which may have been booked meanwhile.
+            self.check_overlap(obj.tutor, obj.student, obj.start, obj.end, instance=obj)
+        obj.save(update_fields=[field])
+        publish_meeting(obj, 'cancelled' if request.method == 'POST' else 'reopened', request.user.type)
         return Response({'status': 'meeting cancelled' if request.method == 'POST' else 'meeting reopened'})
 
+    @transaction.atomic()
+    def bulk_action(self, request, action, event):
+        """
+        Apply ``action`` to the meetings listed in ``meetings`` with one
+        UPDATE and report per meeting whether it changed.
+        """
+        ids = request.data.get('meetings')
+        if not isinstance(ids, list) or not ids or not all(type(pk) is int for pk in ids):
+            raise ValidationError({'meetings': 'a list of meeting ids is required'})
+        if len(ids) > MAX_BULK_MEETINGS:
+            raise ValidationError({'meetings': 'at most %s meetings are allowed' % MAX_BULK_MEETINGS})
+        side = request.user.type
+        # Owned meetings, locked so the eligibility check holds until the update.
+        owned = request.user.profile.meetings.filter(pk__in=ids).select_for_update()
+        eligible = list(owned.eligible(action, side).only(
+            'pk', 'student_id', 'tutor_id', 'start', 'end', '%s_cancelled_at' % Meeting.other_side(side),
+        ))
+        conflicts = set()
+        if action == 'reopen':
+            conflicts = self.reopen_conflicts(eligible, side)
+            eligible = [meeting for meeting in eligible if meeting.pk not in conflicts]
+        owned = set(owned.values_list('pk', flat=True))
+        if eligible:
+            getattr(Meeting.objects.filter(pk__in=[meeting.pk for meeting in eligible]), action)(side)
+            publish_meetings(eligible, event, side)
+
+        changed = {meeting.pk for meeting in eligible}
+        results = []
+        for pk in ids:
+            if pk in changed:
+                status = event
+            elif pk in conflicts:
+                status = 'overlaps another meeting'
+            elif pk in owned:
+                status = 'unchanged'
+            else:
+                status = 'not found'
+            results.append({'meeting': pk, 'status': status})
+        return Response({'results': results})
+
+    def reopen_conflicts(self, meetings, side):
+        """
+        Pks of the ``meetings`` that reopening would make overlap another
+        active meeting of their tutor or student, like check_overlap, or one
+        reopened before them.
+        """
+        other_cancelled = '%s_cancelled_at' % Meeting.other_side(side)
+        # Meetings the other side cancelled stay cancelled.
+        reviving = sorted(
+            (meeting for meeting in meetings if getattr(meeting, other_cancelled) is None),
+            key=lambda meeting: (meeting.start, meeting.pk),
+        )
+        if not reviving:
+            return set()
+        tutor_ids = sorted({meeting.tutor_id for meeting in reviving})
+        student_ids = sorted({meeting.student_id for meeting in reviving})
+        list(Tutor.objects.select_for_update().filter(pk__in=tutor_ids).order_by('pk').values_list('pk'))
+        list(Student.objects.select_for_update().filter(pk__in=student_ids).order_by('pk').values_list('pk'))
+        active = list(Meeting.objects.filter(
+            Q(tutor_id__in=tutor_ids) | Q(student_id__in=student_ids),
+            start__lt=max(meeting.end for meeting in reviving),
+            end__gt=min(meeting.start for meeting in reviving),
+        ).exclude(state=Meeting.CANCELLED).values_list('tutor_id', 'student_id', 'start', 'end'))
+
+        conflicts = set()
+        for meeting in reviving:
+            if any(
+                (tutor_id == meeting.tutor_id or student_id == meeting.student_id)
+                and start < meeting.end and end > meeting.start
+                for tutor_id, student_id, start, end in active
+            ):
+                conflicts.add(meeting.pk)
+            else:
+                active.append((meeting.tutor_id, meeting.student_id, meeting.start, meeting.end))
+        return conflicts
+
+    @list_route(['post'])
+    def bulk_accept(self, request):
+        return self.bulk_action(request, 'accept', 'accepted')
+
+    @list_route(['post'])
+    def bulk_cancel(self, request):
+        return self.bulk_action(request, 'cancel', 'cancelled')
+
+    @list_route(['post'])
+    def bulk_reopen(self, request):
+        return self.bulk_action(request, 'reopen', 'reopened')
+
+    @list_route(['get', 'post'])
+    def feed(self, request):
+        """URL of the user's iCalendar feed; POST replaces it with a new one."""
+        feed, created = CalendarFeed.objects.get_or_create(user=request.user)
+        if request.method == 'POST' and not created:
+            feed.rotate()
+        url = request.build_absolute_uri(reverse('calendar-feed', kwargs={'token': feed.token}))
+        return Response({'url': url})
+
     @detail_route(['post', 'put', 'delete'], permission_classes=[IsStudent], serializer_class=ReviewSerializer)
+    @transaction.atomic()
     def review(self, request, pk):
         meeting = self.get_object()
         if meeting.end >= timezone.now():
             raise ValidationError('cannot review meetings in the future')
+        # Concurrent edits of the review must not both remove the same old rating.
+        meeting = Meeting.objects.select_for_update().get(pk=meeting.pk)
         if request.method == 'POST' or request.method == 'PUT':
             review = getattr(meeting, 'review', None)
+            old_rating = review.rating if review else None
             serializer = ReviewSerializer(instance=review, data=request.data)
             if serializer.is_valid():
-                serializer.save(meeting=meeting)
+                review = serializer.save(meeting=meeting)
+                meeting.tutor.update_rating(added=review.rating, removed=old_rating)
                 return Response(serializer.data, status=201 if request.method == 'POST' else 200)
             return Response(serializer.errors, status=400)
         if request.method == 'DELETE':
             review = getattr(meeting, 'review', None)
             if review:
                 review.delete()
+                meeting.tutor.update_rating(removed=review.rating)
                 return Response({'status': 'review deleted'})
             return Response({'status': 'no review to delete'}, status=400)
         self.http_method_not_allowed(request)
+
+
+def parse_moment(value):
+    """An aware datetime from an ISO date or datetime query parameter."""
+    moment = parse_datetime(value)
+    if moment is None:
+        date = parse_date(value)
+        if date is None:
+            raise ValidationError('invalid date: %s' % value)
+        moment = datetime.datetime.combine(date, datetime.time())
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class TutorCalendarMixin:
+    """Views of a tutor's calendar, nested under the tutor."""
+    permission_classes = [IsParentOwnerOrReadOnly]
+
+    def get_parent_object(self):
+        return get_object_or_404(Tutor, pk=self.kwargs['tutor_pk'])
+
+    def perform_create(self, serializer):
+        parent = self.get_parent_object()
+        if parent.user_id != self.request.user.pk and not self.request.user.is_superuser:
+            self.permission_denied(self.request)
+        serializer.save(tutor=parent)
+
+
+class AvailabilityViewSet(TutorCalendarMixin, ModelViewSet):
+    serializer_class = AvailabilitySerializer
+
+    def get_queryset(self):
+        return self.get_parent_object().availabilities.all()
+
+    @list_route(['get'])
+    def free(self, request, tutor_pk):
+        """Open intervals between ``start`` and ``end`` (default: the coming week)."""
+        start = parse_moment(request.query_params['start']) if 'start' in request.query_params else timezone.now()
+        if 'end' in request.query_params:
+            end = parse_moment(request.query_params['end'])
+        else:
+            end = start + datetime.timedelta(days=7)
+        if not start < end <= start + MAX_RANGE:
+            raise ValidationError('end must be after start and at most %s days later' % MAX_RANGE.days)
+        slots = free_slots(self.get_parent_object(), start, end)
+        field = serializers.DateTimeField()
+        return Response({'results': [
+            {'start': field.to_representation(slot_start), 'end': field.to_representation(slot_end)}
+            for slot_start, slot_end in slots
+        ]})
+
+
+class AvailabilityExceptionViewSet(TutorCalendarMixin, ModelViewSet):
+    serializer_class = AvailabilityExceptionSerializer
+
+    def get_queryset(self):
+        return self.get_parent_object().availability_exceptions.order_by('start')
+
+
+def calendar_feed(request, token):
+    """
+    The meetings of the feed's owner as an iCalendar file. The ETag only
+    changes when one of their meetings does, so polling calendar apps mostly
+    get a 304 without the calendar being rendered. Meetings are touched when
+    the names or locations they show change, see signals.py.
+    """
+    feed = CalendarFeed.objects.select_related('user').filter(token=token).first()
+    if feed is None or feed.user.type not in (User.STUDENT, User.TUTOR):
+        raise Http404()
+    side = feed.user.type
+    meetings = Meeting.objects.filter(**{'%s__user' % side: feed.user})
+    summary = meetings.aggregate(count=Count('pk'), updated_at=Max('updated_at'))
+    updated_at = summary['updated_at']
+    etag = quote_etag('meetings-%s-%s-%s' % (
+        feed.user.pk, summary['count'], updated_at.timestamp() if updated_at else 0,
+    ))
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        meetings = meetings.select_related('tutor__user', 'student__user', 'location').order_by('start', 'pk')
+        response = StreamingHttpResponse(
+            render_calendar(meetings.iterator(), side, request.get_host()),
+            content_type='text/calendar; charset=utf-8',
+        )
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, max_age=0)
+    return response
@@ -0,0 +1,146 @@
+import asyncio
+from urllib.parse import parse_qs
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.generic.http import AsyncHttpConsumer
+from channels.generic.websocket import JsonWebsocketConsumer
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+
+from accounts.models import User
+from .events import thread_group
+from .models import Message, MessageThread
+from .notify import get_notifier
+from .pagination import MessagePagination
+from .serializers import MessageSerializer
+
+
+def get_scope_user(scope):
+    """
+    The user of an ASGI connection: from the session, an
+    ``Authorization: Token <key>`` header or a ``?token=<key>`` parameter.
+    """
+    user = scope.get('user')
+    if user is not None and user.is_authenticated:
+        return user
+    key = None
+    for name, value in scope.get('headers', []):
+        if name == b'authorization' and value.startswith(b'Token '):
+            key = value[len(b'Token '):].decode('latin-1')
+    if key is None:
+        key = parse_qs(scope.get('query_string', b'').decode()).get('token', [None])[0]
+    if key:
+        token = Token.objects.select_related('user').filter(key=key).first()
+        if token is not None and token.user.is_active:
+            return token.user
+    return None
+
+
+def get_thread_pk(user, pk):
+    """The thread between ``user`` and the profile ``pk`` of the other party, like the REST routes."""
+    if user.type == User.STUDENT:
+        lookup = {'student__user': user, 'tutor_id': pk}
+    elif user.type == User.TUTOR:
+        lookup = {'tutor__user': user, 'student_id': pk}
+    else:
+        return None
+    return MessageThread.objects.filter(**lookup).values_list('pk', flat=True).first()
+
+
+class MessageThreadConsumer(JsonWebsocketConsumer):
+    """Pushes new messages and meeting events of a thread."""
+    group = None
+
+    def connect(self):
+        user = get_scope_user(self.scope)
+        thread_pk = get_thread_pk(user, self.scope['url_route']['kwargs']['pk']) if user else None
+        if thread_pk is None:
+            self.close()
+            return
+        self.group = thread_group(thread_pk)
+        async_to_sync(self.channel_layer.group_add)(self.group, self.channel_name)
+        self.accept()
+
+    def disconnect(self, code):
+        if self.group is not None:
+            async_to_sync(self.channel_layer.group_discard)(self.group, self.channel_name)
+
+    def thread_event(self, event):
+        self.send_json(event['payload'])
+
+
+class MessagePollConsumer(AsyncHttpConsumer):
+    """
+    Long poll for a thread: ``GET ?since=<cursor>&timeout=<seconds>`` answers
+    as soon as there are messages after the cursor (or any messages, without
+    one) or another event such as a meeting change, or with an empty result
+    once the timeout elapses. Waiting costs no worker thread.
+    """
+    default_timeout = 25
+    max_timeout = 55
+
+    async def handle(self, body):
+        if self.scope['method'] != 'GET':
+            return await self.send_json(405, {'detail': 'Method not allowed.'})
+        user = await database_sync_to_async(get_scope_user)(self.scope)
+        if user is None:
+            return await self.send_json(401, {'detail': 'Authentication credentials were not provided.'})
+        thread_pk = await database_sync_to_async(get_thread_pk)(user, self.scope['url_route']['kwargs']['pk'])
+        if thread_pk is None:
+            return await self.send_json(404, {'detail': 'Not found.'})
+
+        query = parse_qs(self.scope.get('query_string', b'').decode())
+        paginator = MessagePagination()
+        try:
+            since = paginator.decode_message_cursor(query['since'][0]) if 'since' in query else None
+            timeout = min(max(float(query.get('timeout', [self.default_timeout])[0]), 0), self.max_timeout)
+        except (NotFound, ValueError):
+            return await self.send_json(400, {'detail': 'Invalid since or timeout.'})
+
+        notifier = get_notifier()
+        # Subscribe before looking, so nothing sent in between is missed.
+        queue = notifier.subscribe(thread_pk)
+        events = []
+        try:
+            messages = await database_sync_to_async(self.fetch)(thread_pk, since, user.type)
+            loop = asyncio.get_event_loop()
+            deadline = loop.time() + timeout
+            while not messages and not events:
+                try:
+                    event = await asyncio.wait_for(queue.get(), deadline - loop.time())
+                except asyncio.TimeoutError:
+                    break
+                if event.get('type') == 'message':
+                    messages = await database_sync_to_async(self.fetch)(thread_pk, since, user.type)
+                else:
+                    events.append(event)
+        finally:
+            notifier.unsubscribe(thread_pk, queue)
+
+        if messages:
+            since = (messages[-1].sent_at, messages[-1].pk)
+        await self.send_json(200, {
+            'since': paginator.encode_cursor([since[0].isoformat(), since[1]]) if since else None,
+            'results': MessageSerializer(messages, many=True).data,
+            'events': events,
+        })
+
+    def fetch(self, thread_pk, since, side):
+        messages = Message.objects.filter(thread_id=thread_pk)
+        if since is None:
+            messages = list(messages.order_by('-sent_at', '-pk')[:MessagePagination.page_size])[::-1]
+        else:
+            messages = list(messages.filter(
+                MessagePagination.after(*since),
+            ).order_by('sent_at', 'pk')[:MessagePagination.page_size])
+        if messages:
+            MessageThread(pk=thread_pk).mark_read(side, messages[-1].sent_at)
+        return messages
+
+    async def send_json(self, status, data):
+        await self.send_response(status, JSONRenderer().render(data), headers=[
+            (b'Content-Type', b'application/json'),
+            (b'Cache-Control', b'no-cache'),
+        ])
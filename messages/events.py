@@ -0,0 +1,81 @@
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .models import MessageThread
+from .notify import get_notifier
+
+logger = logging.getLogger(__name__)
+
+
+def thread_group(thread_pk):
+    return 'thread-%s' % thread_pk
+
+
+def publish(thread_pk, payload):
+    """
+    Push ``payload`` to every socket and long poll following the thread once
+    the transaction commits.
+    """
+    publish_many([(thread_pk, payload)])
+
+
+def wake_up_event(payload):
+    """
+    The event long polls are woken with. Pollers load new messages from the
+    database, so message events only carry the message's pk: NOTIFY payloads
+    must stay below 8000 bytes whatever the message length.
+    """
+    if payload.get('type') == 'message':
+        return {'type': 'message', 'message_id': payload['message']['pk']}
+    return payload
+
+
+def publish_many(events):
+    """
+    Like publish, for a list of ``(thread_pk, payload)`` pairs. Delivery
+    failures are only logged: the write has committed by then, and failing
+    the request would make clients retry it.
+    """
+    def send():
+        try:
+            get_notifier().notify_many([(thread_pk, wake_up_event(payload)) for thread_pk, payload in events])
+        except Exception:
+            logger.exception("Waking long polls for %s thread events failed", len(events))
+        try:
+            layer = get_channel_layer()
+        except Exception:
+            logger.exception("Loading the channel layer failed")
+            return
+        if layer is not None:
+            for thread_pk, payload in events:
+                event = {'type': 'thread.event', 'payload': payload}
+                try:
+                    async_to_sync(layer.group_send)(thread_group(thread_pk), event)
+                except Exception:
+                    logger.exception("Sending an event to thread %s failed", thread_pk)
+    transaction.on_commit(send)
+
+
+def publish_meeting(meeting, event, side):
+    """Announce a meeting change in the thread between its student and tutor."""
+    publish_meetings([meeting], event, side)
+
+
+def publish_meetings(meetings, event, side):
+    """Like publish_meeting for many meetings, with a single thread lookup."""
+    if not meetings:
+        return
+    threads = {}
+    for thread_pk, student_pk, tutor_pk in MessageThread.objects.filter(
+        student_id__in={meeting.student_id for meeting in meetings},
+        tutor_id__in={meeting.tutor_id for meeting in meetings},
+    ).values_list('pk', 'student_id', 'tutor_id'):
+        threads.setdefault((student_pk, tutor_pk), []).append(thread_pk)
+    publish_many([
+        (thread_pk, {'type': 'meeting', 'event': event, 'meeting': meeting.pk, 'by': side})
+        for meeting in meetings
+        for thread_pk in threads.get((meeting.student_id, meeting.tutor_id), [])
+    ])
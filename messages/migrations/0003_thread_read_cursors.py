@@ -0,0 +1,27 @@
+# Generated by Django 2.0 on 2026-10-18 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0002_auto_20180326_1235'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagethread',
+            name='student_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='tutor_read_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['thread', 'sent_at', 'id'], name='message_thread_sent_at'),
+        ),
+    ]
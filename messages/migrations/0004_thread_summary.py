@@ -0,0 +1,78 @@
+# Generated by Django 2.0 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+PREVIEW_LENGTH = 200
+
+
+def backfill_summaries(apps, schema_editor):
+    MessageThread = apps.get_model('messaging', 'MessageThread')
+    Message = apps.get_model('messaging', 'Message')
+    for thread in MessageThread.objects.iterator():
+        last = Message.objects.filter(thread=thread).order_by('-sent_at', '-pk').first()
+        if last is not None:
+            thread.last_message_at = last.sent_at
+            thread.last_message_preview = last.content[:PREVIEW_LENGTH]
+            thread.last_message_by = last.sent_by
+        for side, other in (('student', 'tutor'), ('tutor', 'student')):
+            unread = Message.objects.filter(thread=thread, sent_by=other)
+            read_at = getattr(thread, '%s_read_at' % side)
+            if read_at is not None:
+                unread = unread.filter(sent_at__gt=read_at)
+            setattr(thread, '%s_unread_count' % side, unread.count())
+        thread.save()
+
+
+def create_inbox_indexes(apps, schema_editor):
+    # Matches the inbox ordering, which Index can't express.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for side in ('student', 'tutor'):
+        schema_editor.execute(
+            'CREATE INDEX messagethread_%s_inbox ON messaging_messagethread '
+            '(%s_id, last_message_at DESC NULLS LAST, id DESC)' % (side, side)
+        )
+
+
+def drop_inbox_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for side in ('student', 'tutor'):
+        schema_editor.execute('DROP INDEX IF EXISTS messagethread_%s_inbox' % side)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0003_thread_read_cursors'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='messagethread',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='last_message_by',
+            field=models.CharField(blank=True, max_length=20),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='last_message_preview',
+            field=models.CharField(blank=True, max_length=200),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='student_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='messagethread',
+            name='tutor_unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_summaries, migrations.RunPython.noop),
+        migrations.RunPython(create_inbox_indexes, drop_inbox_indexes),
+    ]
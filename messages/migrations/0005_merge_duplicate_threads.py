@@ -0,0 +1,51 @@
+# Generated by Django 2.0 on 2026-10-18 17:40
+
+from django.db import migrations
+from django.db.models import Count, Min
+
+PREVIEW_LENGTH = 200
+
+
+def merge_duplicate_threads(apps, schema_editor):
+    """
+    Move the messages of duplicate threads of a student and tutor into the
+    oldest one, so that the pair can be made unique.
+    """
+    MessageThread = apps.get_model('messaging', 'MessageThread')
+    Message = apps.get_model('messaging', 'Message')
+    duplicates = MessageThread.objects.filter(student__isnull=False, tutor__isnull=False).values(
+        'student_id', 'tutor_id',
+    ).annotate(count=Count('pk'), keep=Min('pk')).filter(count__gt=1)
+    for pair in duplicates:
+        threads = list(MessageThread.objects.filter(student_id=pair['student_id'], tutor_id=pair['tutor_id']))
+        thread = next(thread for thread in threads if thread.pk == pair['keep'])
+        others = [other.pk for other in threads if other.pk != thread.pk]
+        Message.objects.filter(thread_id__in=others).update(thread_id=thread.pk)
+        MessageThread.objects.filter(pk__in=others).delete()
+
+        last = Message.objects.filter(thread=thread).order_by('-sent_at', '-pk').first()
+        if last is not None:
+            thread.last_message_at = last.sent_at
+            thread.last_message_preview = last.content[:PREVIEW_LENGTH]
+            thread.last_message_by = last.sent_by
+        for side, other in (('student', 'tutor'), ('tutor', 'student')):
+            # Only what was read in every thread counts as read.
+            read_ats = [getattr(duplicate, '%s_read_at' % side) for duplicate in threads]
+            read_at = None if None in read_ats else min(read_ats)
+            setattr(thread, '%s_read_at' % side, read_at)
+            unread = Message.objects.filter(thread=thread, sent_by=other)
+            if read_at is not None:
+                unread = unread.filter(sent_at__gt=read_at)
+            setattr(thread, '%s_unread_count' % side, unread.count())
+        thread.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0004_thread_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_threads, migrations.RunPython.noop),
+    ]
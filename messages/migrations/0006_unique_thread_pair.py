@@ -0,0 +1,17 @@
+# Generated by Django 2.0 on 2026-10-18 17:41
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('messaging', '0005_merge_duplicate_threads'),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='messagethread',
+            unique_together={('student', 'tutor')},
+        ),
+    ]
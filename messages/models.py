@@ -1,12 +1,94 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce, Greatest
 from django.utils import timezone
 
 
+PREVIEW_LENGTH = 200
+
+
+class MessageThreadQuerySet(models.QuerySet):
+    def inbox(self, side):
+        """Threads with their newest message first, with the unread count of ``side``."""
+        return self.annotate(
+            unread_count=F('%s_unread_count' % side),
+        ).order_by(F('last_message_at').desc(nulls_last=True), '-pk')
+
+    @transaction.atomic()
+    def add_message(self, sent_by, content):
+        """
+        Send the same message to every thread in the queryset with one insert
+        and one summary update. Returns the messages in thread pk order.
+        """
+        thread_pks = sorted(self.values_list('pk', flat=True))
+        sent_at = timezone.now()
+        messages = Message.objects.bulk_create([
+            Message(thread_id=pk, sent_by=sent_by, content=content, sent_at=sent_at) for pk in thread_pks
+        ])
+        MessageThread.objects.filter(pk__in=thread_pks).update(**MessageThread.summary_update(sent_by, content, sent_at))
+        return messages
+
+
 class MessageThread(models.Model):
     student = models.ForeignKey('accounts.Student', on_delete=models.SET_NULL, null=True,
                                 related_name='message_threads')
     tutor = models.ForeignKey('accounts.Tutor', on_delete=models.SET_NULL, null=True,
                               related_name='message_threads')
+    # Summary of the newest message, maintained by add_message.
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    last_message_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True)
+    last_message_by = models.CharField(max_length=20, blank=True)
+    # sent_at of the newest message each side has seen and the number of
+    # messages from the other side after it.
+    student_read_at = models.DateTimeField(null=True, blank=True)
+    tutor_read_at = models.DateTimeField(null=True, blank=True)
+    student_unread_count = models.PositiveIntegerField(default=0)
+    tutor_unread_count = models.PositiveIntegerField(default=0)
+
+    objects = MessageThreadQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('student', 'tutor')
+
+    @staticmethod
+    def other_side(side):
+        return Message.TUTOR if side == Message.STUDENT else Message.STUDENT
+
+    @staticmethod
+    def summary_update(sent_by, content, sent_at):
+        """Values updating the summary of a thread for a new message, unless it already has a newer one."""
+        unread = '%s_unread_count' % MessageThread.other_side(sent_by)
+        return {
+            'last_message_at': Greatest(Coalesce('last_message_at', sent_at), sent_at),
+            'last_message_preview': Case(
+                When(last_message_at__gt=sent_at, then=F('last_message_preview')),
+                default=Value(content[:PREVIEW_LENGTH]),
+            ),
+            'last_message_by': Case(
+                When(last_message_at__gt=sent_at, then=F('last_message_by')),
+                default=Value(sent_by),
+            ),
+            unread: F(unread) + 1,
+        }
+
+    @transaction.atomic()
+    def add_message(self, sent_by, content, sent_at=None):
+        """Create a message and update the thread summary in the same transaction."""
+        message = self.messages.create(sent_by=sent_by, content=content, sent_at=sent_at or timezone.now())
+        MessageThread.objects.filter(pk=self.pk).update(**self.summary_update(sent_by, content, message.sent_at))
+        return message
+
+    @transaction.atomic()
+    def mark_read(self, side, sent_at):
+        """Move the read cursor of ``side`` forward to ``sent_at`` and recount its unread messages."""
+        field = '%s_read_at' % side
+        read_at = MessageThread.objects.select_for_update().filter(pk=self.pk).values_list(field, flat=True).first()
+        if read_at is not None and read_at >= sent_at:
+            return
+        # The thread row is locked, so messages added meanwhile are counted by
+        # add_message once the lock is released, not here.
+        unread = Message.objects.filter(thread_id=self.pk, sent_at__gt=sent_at).exclude(sent_by=side).count()
+        MessageThread.objects.filter(pk=self.pk).update(**{field: sent_at, '%s_unread_count' % side: unread})
 
 
 class Message(models.Model):
@@ -20,3 +102,8 @@ class Message(models.Model):
     content = models.TextField()
     sent_at = models.DateTimeField(default=timezone.now)
     sent_by = models.CharField(choices=SENT_BY_CHOICES, max_length=20)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['thread', 'sent_at', 'id'], name='message_thread_sent_at'),
+        ]
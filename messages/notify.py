@@ -0,0 +1,105 @@
+"""
+Wake-ups for long-polling clients. Events for a thread are broadcast with
+Postgres NOTIFY so that they reach the ASGI process serving the poll no matter
+which process wrote the message; other databases (SQLite test runs) use an
+in-process notifier.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+import psycopg2
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'thread_events'
+
+
+class Notifier:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # thread pk -> {queue: event loop the queue belongs to}
+        self.subscribers = defaultdict(dict)
+
+    def subscribe(self, thread_pk):
+        """Queue receiving the events of a thread from now on; must be called on the event loop."""
+        queue = asyncio.Queue()
+        with self.lock:
+            self.subscribers[thread_pk][queue] = asyncio.get_event_loop()
+        return queue
+
+    def unsubscribe(self, thread_pk, queue):
+        with self.lock:
+            self.subscribers[thread_pk].pop(queue, None)
+            if not self.subscribers[thread_pk]:
+                del self.subscribers[thread_pk]
+
+    def dispatch(self, thread_pk, event):
+        with self.lock:
+            queues = list(self.subscribers.get(thread_pk, {}).items())
+        for queue, loop in queues:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    def notify(self, thread_pk, event):
+        self.notify_many([(thread_pk, event)])
+
+    def notify_many(self, events):
+        for thread_pk, event in events:
+            self.dispatch(thread_pk, event)
+
+
+class PostgresNotifier(Notifier):
+    def __init__(self):
+        super().__init__()
+        self.listener = None
+
+    def notify_many(self, events):
+        # Events are small (see events.wake_up_event); messages are not sent along.
+        payloads = [json.dumps({'thread': thread_pk, 'event': event}) for thread_pk, event in events]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, payload) FROM unnest(%s::text[]) AS payload', [CHANNEL, payloads])
+
+    def subscribe(self, thread_pk):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, name='thread-events-listener', daemon=True)
+                self.listener.start()
+        return super().subscribe(thread_pk)
+
+    def listen(self):
+        """Dedicated LISTEN connection, reconnecting if it drops."""
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**connection.get_connection_params())
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cursor:
+                    cursor.execute('LISTEN %s' % CHANNEL)
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notification = conn.notifies.pop(0)
+                        data = json.loads(notification.payload)
+                        self.dispatch(data['thread'], data['event'])
+            except Exception:
+                logger.exception("Thread event listener failed, reconnecting")
+                if conn is not None:
+                    conn.close()
+                time.sleep(1)
+
+
+_notifier = None
+
+
+def get_notifier():
+    global _notifier
+    if _notifier is None:
+        _notifier = PostgresNotifier() if connection.vendor == 'postgresql' else Notifier()
+    return _notifier
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from accounts.pagination import KeysetPagination
+
+
+class MessagePagination(KeysetPagination):
+    """
+    Windows of a thread's messages keyed on (sent_at, pk), always returned
+    oldest first. Without a cursor the latest page is returned; ``since``
+    returns messages after a cursor (for polling), ``before`` the page of
+    messages preceding it (for scrolling back).
+    """
+    page_size = 50
+    since_query_param = 'since'
+    before_query_param = 'before'
+    keys = ['sent_at', 'pk']
+
+    @staticmethod
+    def after(sent_at, pk):
+        return Q(sent_at__gt=sent_at) | Q(sent_at=sent_at, pk__gt=pk)
+
+    @staticmethod
+    def before(sent_at, pk):
+        return Q(sent_at__lt=sent_at) | Q(sent_at=sent_at, pk__lt=pk)
+
+    def parse_cursor(self, request, param):
+        if param not in request.query_params:
+            return None
+        return self.decode_message_cursor(request.query_params[param])
+
+    def decode_message_cursor(self, encoded):
+        sent_at, pk = self.decode(encoded)
+        try:
+            # Well-formed but out of range values raise ValueError.
+            sent_at = parse_datetime(sent_at) if isinstance(sent_at, str) else None
+        except ValueError:
+            sent_at = None
+        if sent_at is None or not isinstance(pk, int) or isinstance(pk, bool):
+            raise NotFound(self.invalid_cursor_message)
+        return sent_at, pk
+
+    def cursor_for(self, message):
+        return self.encode_cursor([message.sent_at.isoformat(), message.pk])
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size_value = self.get_page_size(request)
+        since = self.parse_cursor(request, self.since_query_param)
+        before = self.parse_cursor(request, self.before_query_param)
+        self.since = since
+
+        if since is not None:
+            queryset = queryset.filter(self.after(*since))
+            self.page = list(queryset.order_by('sent_at', 'pk')[:self.page_size_value])
+            self.has_older = True
+        else:
+            if before is not None:
+                queryset = queryset.filter(self.before(*before))
+            rows = list(queryset.order_by('-sent_at', '-pk')[:self.page_size_value + 1])
+            self.has_older = len(rows) > self.page_size_value
+            self.page = rows[:self.page_size_value][::-1]
+        return self.page
+
+    def get_link(self, param, cursor):
+        url = self.request.build_absolute_uri()
+        for other in (self.since_query_param, self.before_query_param):
+            url = remove_query_param(url, other)
+        return replace_query_param(url, param, cursor)
+
+    def get_next_link(self):
+        """Where to poll for newer messages; stays put when nothing new arrived."""
+        if self.page:
+            cursor = self.cursor_for(self.page[-1])
+        elif self.since is not None:
+            cursor = self.encode_cursor([self.since[0].isoformat(), self.since[1]])
+        else:
+            return self.request.build_absolute_uri()
+        return self.get_link(self.since_query_param, cursor)
+
+    def get_previous_link(self):
+        if not self.has_older or not self.page:
+            return None
+        return self.get_link(self.before_query_param, self.cursor_for(self.page[0]))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
@@ -1,6 +1,11 @@
+from collections import OrderedDict
+
 from rest_framework import serializers
 
 from .models import Message, MessageThread
+from .pagination import MessagePagination
+
+MAX_RECIPIENTS = 500
 
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -11,9 +16,44 @@ class MessageSerializer(serializers.ModelSerializer):
 
 class MessageThreadSerializer(serializers.ModelSerializer):
     content = serializers.CharField(write_only=True)
-    messages = MessageSerializer(many=True, read_only=True)
+    messages = serializers.SerializerMethodField()
+
+    def get_messages(self, obj):
+        """The latest page of messages; older ones are fetched through the messages route."""
+        latest = obj.messages.order_by('-sent_at', '-pk')[:MessagePagination.page_size]
+        return MessageSerializer(list(latest)[::-1], many=True).data
 
     class Meta:
         model = MessageThread
         fields = ['content', 'student', 'tutor', 'messages']
         read_only_fields = ['student', 'tutor']
+
+
+class MessageThreadSummarySerializer(serializers.ModelSerializer):
+    last_message = serializers.SerializerMethodField()
+    unread_count = serializers.IntegerField(read_only=True)
+
+    def get_last_message(self, obj):
+        if obj.last_message_at is None:
+            return None
+        return {
+            'content': obj.last_message_preview,
+            'sent_at': serializers.DateTimeField().to_representation(obj.last_message_at),
+            'sent_by': obj.last_message_by,
+        }
+
+    class Meta:
+        model = MessageThread
+        fields = ['pk', 'student', 'tutor', 'last_message', 'unread_count']
+
+
+class BroadcastSerializer(serializers.Serializer):
+    content = serializers.CharField()
+    recipients = serializers.ListField(child=serializers.IntegerField())
+
+    def validate_recipients(self, value):
+        if not value:
+            raise serializers.ValidationError('At least one recipient is required.')
+        if len(value) > MAX_RECIPIENTS:
+            raise serializers.ValidationError('At most %s recipients are allowed.' % MAX_RECIPIENTS)
+        return list(OrderedDict.fromkeys(value))
@@ -1,9 +1,23 @@
+import asyncio
 import datetime
+import json
+
+from asgiref.sync import async_to_sync
+from channels.db import database_sync_to_async
+from channels.testing import HttpCommunicator, WebsocketCommunicator
+from django.db import connection
+from django.test import TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
 from rest_framework.test import APITestCase, APIClient
 
+from findmytutor.routing import application
+
 from accounts.models import User, Tutor, Student
 from .models import MessageThread, Message
+from .pagination import MessagePagination
 
 
 class MessagesTestCase(APITestCase):
@@ -77,3 +91,185 @@ class MessagesTestCase(APITestCase):
         self.assertEqual(response.status_code, 200)
         data = response.json()
         self.assertEqual(len(data), 1)
+
+    def test_thread_summary(self):
+        self.thread.add_message('tutor', "Hi!")
+        self.thread.add_message('tutor', "When are you available?")
+        client = APIClient()
+        client.force_authenticate(self.student)
+        response = client.get(reverse('messagethread-list'))
+        thread = response.json()[0]
+        self.assertNotIn('messages', thread)
+        self.assertEqual(thread['last_message']['content'], "When are you available?")
+        self.assertEqual(thread['last_message']['sent_by'], 'tutor')
+        self.assertEqual(thread['unread_count'], 2)
+
+        client.get(reverse('messagethread-messages', kwargs={'pk': self.tutor.profile.pk}))
+        response = client.get(reverse('messagethread-list'))
+        self.assertEqual(response.json()[0]['unread_count'], 0)
+
+    def test_mark_read(self):
+        self.thread.add_message('student', "Hi!")
+        self.thread.add_message('student', "Are you there?")
+        client = APIClient()
+        client.force_authenticate(self.tutor)
+        response = client.get(reverse('messagethread-list'))
+        self.assertEqual(response.json()[0]['unread_count'], 2)
+        response = client.post(reverse('messagethread-read', kwargs={'pk': self.student.profile.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['unread_count'], 0)
+        self.assertEqual(response.json()['last_message']['content'], "Are you there?")
+
+        self.thread.add_message('student', "Hello?")
+        self.thread.add_message('tutor', "Yes, sorry!")
+        with self.assertNumQueries(1):
+            response = client.get(reverse('messagethread-list'))
+        self.assertEqual(response.json()[0]['unread_count'], 1)
+        self.assertEqual(response.json()[0]['last_message']['sent_by'], 'tutor')
+
+    def test_broadcast(self):
+        tutor = self.tutor.profile
+        students = [
+            Student.objects.create(
+                user=User.objects.create_user('student%s' % i, type=User.STUDENT),
+                date_of_birth=datetime.date(1999, 12, 31),
+            )
+            for i in range(5)
+        ]
+        tutor.students.add(*students)
+        stranger = Student.objects.create(
+            user=User.objects.create_user('stranger', type=User.STUDENT), date_of_birth=datetime.date(1999, 12, 31),
+        )
+        recipients = [self.student.profile.pk] + [student.pk for student in students] + [stranger.pk]
+        client = APIClient()
+        client.force_authenticate(self.tutor)
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post(reverse('messagethread-broadcast'), data={
+                'content': "No lessons next week.",
+                'recipients': recipients,
+            }, format='json')
+        # A fixed number of statements (including savepoints), whatever the number of recipients.
+        self.assertLessEqual(len(queries), 12)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()['results']
+        self.assertEqual([result['recipient'] for result in results], recipients)
+        self.assertEqual([result['status'] for result in results], ['sent'] * 6 + ['not found'])
+        self.assertEqual(results[0]['thread'], self.thread.pk)
+        self.assertFalse(MessageThread.objects.filter(student=stranger).exists())
+
+        for student in [self.student.profile] + students:
+            thread = MessageThread.objects.get(student=student, tutor=tutor)
+            self.assertEqual([m.content for m in thread.messages.all()], ["No lessons next week."])
+            self.assertEqual(thread.student_unread_count, 1)
+            self.assertEqual(thread.last_message_preview, "No lessons next week.")
+
+    def test_message_cursors(self):
+        start = timezone.now() - datetime.timedelta(hours=1)
+        for i in range(5):
+            self.thread.messages.create(sent_by='student', content=str(i), sent_at=start + datetime.timedelta(minutes=i))
+        client = APIClient()
+        client.force_authenticate(self.tutor)
+        url = reverse('messagethread-messages', kwargs={'pk': self.student.profile.pk})
+
+        data = client.get(url, data={'page_size': 2}).json()
+        self.assertEqual([m['content'] for m in data['results']], ['3', '4'])
+        data_older = client.get(data['previous']).json()
+        self.assertEqual([m['content'] for m in data_older['results']], ['1', '2'])
+        data_oldest = client.get(data_older['previous']).json()
+        self.assertEqual([m['content'] for m in data_oldest['results']], ['0'])
+        self.assertIsNone(data_oldest['previous'])
+
+        poll = client.get(data['next']).json()
+        self.assertEqual(poll['results'], [])
+        self.assertEqual(poll['next'], data['next'])
+        self.thread.messages.create(sent_by='student', content='5')
+        poll = client.get(data['next']).json()
+        self.assertEqual([m['content'] for m in poll['results']], ['5'])
+
+        paginator = MessagePagination()
+        for values in (['2020-13-45T10:00:00+00:00', 1], ['yesterday', 1], [None, 1], [start.isoformat(), 'x']):
+            for param in ('since', 'before'):
+                response = client.get(url, data={param: paginator.encode_cursor(values)})
+                self.assertEqual(response.status_code, 404)
+
+
+# Tests run in a single process, so they don't need Redis whatever
+# CHANNEL_LAYER_BACKEND is set to.
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class MessageThreadConsumerTestCase(TransactionTestCase):
+    # The consumer runs in another thread with its own connection, so the
+    # test data has to be committed.
+
+    def setUp(self):
+        self.student = User.objects.create_user('student', 'student@example.com', type=User.STUDENT)
+        student = Student.objects.create(user=self.student, date_of_birth=datetime.date(1999, 12, 31))
+        self.tutor = User.objects.create_user('tutor', 'tutor@example.com', type=User.TUTOR)
+        tutor = Tutor.objects.create(user=self.tutor, date_of_birth=datetime.date(1999, 12, 31))
+        student.tutors.add(tutor)
+        MessageThread.objects.create(student=student, tutor=tutor)
+        self.token = Token.objects.create(user=self.tutor)
+
+    def send_message(self, content):
+        client = APIClient()
+        client.force_authenticate(self.student)
+        url = reverse('messagethread-detail', kwargs={'pk': self.tutor.tutor.pk})
+        return client.put(url, data={'content': content}, format='json')
+
+    def test_push_message(self):
+        async def scenario():
+            url = '/ws/messages/%s/?token=%s' % (self.student.student.pk, self.token.key)
+            communicator = WebsocketCommunicator(application, url)
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            await database_sync_to_async(self.send_message)('Hello!')
+            event = await communicator.receive_json_from()
+            await communicator.disconnect()
+            return event
+
+        event = async_to_sync(scenario)()
+        self.assertEqual(event['type'], 'message')
+        self.assertEqual(event['message']['content'], 'Hello!')
+        self.assertEqual(event['message']['sent_by'], User.STUDENT)
+
+    @override_settings(CHANNEL_LAYERS={'default': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer', 'CONFIG': {'hosts': ['redis://localhost:1/0']},
+    }})
+    def test_publish_failure_keeps_message(self):
+        # Redis is unreachable; the message is committed and the request succeeds anyway.
+        response = self.send_message('Hello?')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['Hello?'])
+
+    def test_reject_unauthenticated(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(application, '/ws/messages/%s/' % self.student.student.pk)
+            connected, _ = await communicator.connect()
+            return connected
+
+        self.assertFalse(async_to_sync(scenario)())
+
+    def test_long_poll(self):
+        headers = [(b'authorization', ('Token %s' % self.token.key).encode())]
+        url = '/api/messages/%s/poll/' % self.student.student.pk
+
+        async def send_later():
+            await asyncio.sleep(0.2)
+            await database_sync_to_async(self.send_message)('Are you there?')
+
+        async def scenario():
+            poll = HttpCommunicator(application, 'GET', url + '?timeout=10', headers=headers)
+            response, _ = await asyncio.gather(poll.get_response(timeout=15), send_later())
+            first = json.loads(response['body'].decode())
+            poll = HttpCommunicator(application, 'GET', url + '?timeout=0.1&since=' + first['since'], headers=headers)
+            response = await poll.get_response()
+            return first, json.loads(response['body'].decode())
+
+        first, second = async_to_sync(scenario)()
+        self.assertEqual([m['content'] for m in first['results']], ['Are you there?'])
+        self.assertEqual(second['results'], [])
+        self.assertEqual(second['since'], first['since'])
+
+    def test_long_poll_requires_authentication(self):
+        url = '/api/messages/%s/poll/' % self.student.student.pk
+        response = async_to_sync(HttpCommunicator(application, 'GET', url).get_response)()
+        self.assertEqual(response['status'], 401)
@@ -1,17 +1,27 @@
+from django.db import IntegrityError, transaction
 from rest_framework import viewsets, permissions, mixins
+from rest_framework.decorators import detail_route, list_route
+from rest_framework.response import Response
 
 from accounts.models import User
+from findmytutor.replicas import ReplicaReadsMixin
+from .events import publish, publish_many
 from .models import Message, MessageThread
-from .serializers import MessageSerializer, MessageThreadSerializer
+from .pagination import MessagePagination
+from .serializers import (BroadcastSerializer, MessageSerializer, MessageThreadSerializer,
+                          MessageThreadSummarySerializer)
 
 
-class MessageThreadViewSet(mixins.RetrieveModelMixin,
+class MessageThreadViewSet(ReplicaReadsMixin,
+                           mixins.RetrieveModelMixin,
                            mixins.UpdateModelMixin,
                            mixins.ListModelMixin,
                            viewsets.GenericViewSet):
     model = MessageThread
     serializer_class = MessageThreadSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # Reading messages marks them read, so only the inbox uses a replica.
+    replica_actions = ('list',)
 
     def get_object(self):
         if self.request.user.type == User.STUDENT:
@@ -21,13 +31,93 @@ class MessageThreadViewSet(mixins.RetrieveModelMixin,
 
     def get_queryset(self):
         if self.request.user.type == User.STUDENT:
-            return MessageThread.objects.filter(student=self.request.user.student)
+            qs = MessageThread.objects.filter(student=self.request.user.student)
         else:
-            return MessageThread.objects.filter(tutor=self.request.user.tutor)
+            qs = MessageThread.objects.filter(tutor=self.request.user.tutor)
+        if self.action == 'list':
+            qs = qs.inbox(self.request.user.type)
+        return qs
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return MessageThreadSummarySerializer
+        return super().get_serializer_class()
 
     def perform_update(self, serializer):
         thread = serializer.instance
-        message = thread.messages.create(
-            sent_by=self.request.user.type,
-            content=serializer.validated_data['content'],
+        message = thread.add_message(self.request.user.type, serializer.validated_data['content'])
+        publish(thread.pk, {'type': 'message', 'message': dict(MessageSerializer(message).data)})
+
+    @detail_route(['get'])
+    def messages(self, request, pk):
+        thread = self.get_object()
+        paginator = MessagePagination()
+        page = paginator.paginate_queryset(thread.messages.all(), request, view=self)
+        if page and 'before' not in request.query_params:
+            thread.mark_read(request.user.type, page[-1].sent_at)
+        return paginator.get_paginated_response(MessageSerializer(page, many=True).data)
+
+    @detail_route(['post'], url_path='read', url_name='read')
+    def mark_read(self, request, pk):
+        """Mark everything up to the newest message of the thread as read."""
+        thread = self.get_object()
+        if thread.last_message_at is not None:
+            thread.mark_read(request.user.type, thread.last_message_at)
+        thread = self.get_queryset().inbox(request.user.type).get(pk=thread.pk)
+        return Response(MessageThreadSummarySerializer(thread).data)
+
+    @list_route(['post'])
+    @transaction.atomic()
+    def broadcast(self, request):
+        """
+        Send one message to many students (or tutors) at once, creating the
+        missing threads. Recipients are profile pks of the other side; those
+        that aren't related to the sender are reported as not found.
+        """
+        serializer = BroadcastSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipients = serializer.validated_data['recipients']
+        side, profile = request.user.type, request.user.profile
+        if side == User.STUDENT:
+            own, other = 'student', 'tutor'
+            allowed = profile.tutors.filter(pk__in=recipients)
+        elif side == User.TUTOR:
+            own, other = 'tutor', 'student'
+            allowed = profile.students.filter(pk__in=recipients)
+        else:
+            self.permission_denied(request)
+        allowed = set(allowed.values_list('pk', flat=True))
+
+        threads = dict(MessageThread.objects.filter(
+            **{own: profile, '%s_id__in' % other: allowed}
+        ).values_list('%s_id' % other, 'pk'))
+        missing = sorted(allowed - set(threads))
+        try:
+            with transaction.atomic():
+                created = MessageThread.objects.bulk_create([
+                    MessageThread(**{own: profile, '%s_id' % other: pk}) for pk in missing
+                ])
+        except IntegrityError:
+            # Some of the threads were created concurrently, e.g. by my_tutors.
+            created = [
+                MessageThread.objects.get_or_create(**{own: profile, '%s_id' % other: pk})[0] for pk in missing
+            ]
+        threads.update((getattr(thread, '%s_id' % other), thread.pk) for thread in created)
+
+        messages = MessageThread.objects.filter(pk__in=threads.values()).add_message(
+            side, serializer.validated_data['content'],
         )
+        messages = {message.thread_id: message for message in messages}
+        publish_many([
+            (thread_pk, {'type': 'message', 'message': dict(MessageSerializer(message).data)})
+            for thread_pk, message in messages.items()
+        ])
+
+        results = []
+        for pk in recipients:
+            if pk in threads:
+                message = messages[threads[pk]]
+                results.append({'recipient': pk, 'status': 'sent', 'thread': threads[pk], 'message': message.pk})
+            else:
+                results.append({'recipient': pk, 'status': 'not found'})
+        return Response({'results': results})